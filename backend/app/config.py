@@ -13,10 +13,67 @@ class Settings(BaseSettings):
     minimax_api_key: str
     minimax_base_url: str = "https://api.minimax.chat/v1/text/chatcompletion_v2"
     minimax_model: str = "abab6.5s-chat"
+    # Optional comma-separated pools; every key is used on every base URL.
+    # When empty, minimax_api_key / minimax_base_url are the only endpoint.
+    minimax_api_keys: str = ""
+    minimax_base_urls: str = ""
+    
+    # Per-endpoint circuit breaker: trips on failure or slow-call rate over the
+    # last N calls, then half-opens after open_seconds to probe for recovery
+    minimax_breaker_window: int = 20
+    minimax_breaker_min_calls: int = 5
+    minimax_breaker_failure_rate: float = 0.5
+    minimax_breaker_slow_call_seconds: float = 30.0
+    minimax_breaker_slow_rate: float = 0.5
+    minimax_breaker_open_seconds: float = 15.0
+    
+    # MiniMax HTTP connection pool (http2 needs the optional h2 package)
+    minimax_pool_max_connections: int = 100
+    minimax_pool_max_keepalive: int = 20
+    minimax_pool_keepalive_expiry: float = 30.0
+    minimax_http2: bool = False
+    minimax_connect_timeout: float = 5.0
+    minimax_read_timeout: float = 120.0
+    minimax_write_timeout: float = 30.0
+    minimax_pool_timeout: float = 10.0
+    # Connections opened at startup so the first requests skip TCP/TLS setup
+    minimax_prewarm_connections: int = 2
+    
+    # Non-streaming MiniMax calls: jittered retries on 408/409/429/5xx/connect errors,
+    # and a hedge request once a call outlives the observed latency percentile,
+    # with hedges capped at a percentage of calls
+    minimax_max_retries: int = 2
+    minimax_retry_base_delay: float = 0.25
+    minimax_retry_max_delay: float = 4.0
+    minimax_hedge_enabled: bool = True
+    minimax_hedge_percentile: float = 0.95
+    minimax_hedge_min_samples: int = 20
+    minimax_hedge_budget_percent: float = 5.0
     
     # ModelScope Image Generation API (Free!)
     # Get your free token from: https://modelscope.cn/my
     modelscope_api_key: str = ""
+    # Client-side limit matching the ModelScope quota: requests per minute and
+    # burst, shared round-robin between users; waiting generations (at most
+    # modelscope_max_queue) give up with 429 after the timeout
+    modelscope_rate_per_minute: float = 10.0
+    modelscope_burst: int = 5
+    modelscope_max_queue: int = 100
+    modelscope_queue_timeout_seconds: float = 60.0
+    # Generated images are kept on disk and served by URL; least recently
+    # used images are evicted once the store exceeds this size
+    image_store_dir: str = "./sparkie_images"
+    image_store_max_mb: int = 512
+    # WebP and thumbnail variants of each image, rendered by worker processes
+    image_variant_workers: int = 2
+    image_thumbnail_size: int = 256
+    image_webp_quality: int = 82
+    # POST /generate/image/jobs: background workers, jobs queued or running per
+    # user, jobs waiting overall, and how long finished jobs can be looked up
+    image_job_workers: int = 4
+    image_job_max_per_user: int = 2
+    image_job_max_queued: int = 100
+    image_job_result_ttl_seconds: int = 3600
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./sparkie_hive.db"
@@ -34,11 +91,73 @@ class Settings(BaseSettings):
     app_port: int = 8000
     debug: bool = False
     log_level: str = "INFO"
+    # GET /stats requires this in an X-Stats-Token header; when empty, only loopback clients get it
+    stats_token: str = ""
     
     # Rate Limiting
     rate_limit_requests: int = 100
     rate_limit_window: int = 60
     
+    # Context building (token budget covers system prompt, history and reply)
+    context_token_budget: int = 8192
+    context_default_reply_tokens: int = 1024
+    # The time sent to the model is rounded down to this many minutes, so the
+    # request bytes (and the completion cache key) stay stable between turns
+    prompt_time_granularity_minutes: int = 60
+    # Rendered system prompts kept per (username, is_creator)
+    prompt_cache_size: int = 1024
+    
+    # Rolling conversation summaries; the trigger must not exceed history_cache_window
+    summary_enabled: bool = True
+    summary_trigger_messages: int = 40
+    summary_keep_recent: int = 16
+    summary_max_tokens: int = 512
+    
+    # Conversation history cache
+    history_cache_window: int = 50
+    history_cache_max_conversations: int = 1024
+    history_cache_max_bytes: int = 32 * 1024 * 1024
+    
+    # Rows per keyset batch query when streaming message history as NDJSON
+    message_stream_batch_size: int = 500
+    
+    # POST /chat/batch: completions in flight at once per batch request
+    batch_chat_concurrency: int = 8
+    
+    # History export: rows per keyset batch query; log throughput at or above N rows
+    export_batch_size: int = 1000
+    export_log_min_rows: int = 10000
+    
+    # Write-behind message persistence
+    message_writer_queue_size: int = 10000
+    message_writer_batch_size: int = 100
+    message_writer_flush_interval: float = 0.05
+    # Attempts per row after a failed batch, backing off from N seconds, doubling
+    message_writer_max_retries: int = 3
+    message_writer_retry_backoff: float = 0.1
+    
+    # SSE streaming: merge upstream deltas into frames every N ms or N bytes
+    sse_coalesce_interval_ms: int = 30
+    sse_coalesce_max_bytes: int = 1024
+    
+    # How long finished chat streams stay replayable for reconnecting clients
+    stream_retention_seconds: int = 60
+    # Cancel the upstream generation once no client has been attached for this long
+    stream_cancel_grace_seconds: float = 3.0
+    
+    # Upstream admission control: concurrent MiniMax calls, waiting requests and
+    # how long one may wait before being shed with 503 + Retry-After
+    upstream_max_in_flight: int = 32
+    upstream_max_queue: int = 128
+    upstream_queue_timeout_seconds: float = 30.0
+    
+    # Exact-match completion cache (only temperature=0 requests); backend "memory" or "redis".
+    # Keys include the per-user system prompt, so cached replies are per user
+    completion_cache_enabled: bool = False
+    completion_cache_backend: str = "memory"
+    completion_cache_ttl_seconds: int = 3600
+    completion_cache_max_entries: int = 1024
+    
     # CORS
     allowed_origins: str = "http://localhost:3000"
     
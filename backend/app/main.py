@@ -3,18 +3,31 @@ Sparkie - The Queen Bee's Chatbot API
 Main FastAPI application entry point.
 """
 import os
+import secrets
 import sys
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from app.config import settings
 from app.models.database import init_db, close_db
-from app.services.minimax import init_minimax_service, close_minimax_service
-from app.services.modelscope_image import init_modelscope_service, close_modelscope_service
+from app.services.minimax import init_minimax_service, close_minimax_service, get_minimax_service
+from app.services.modelscope_image import init_modelscope_service, close_modelscope_service, get_modelscope_service
+from app.services.image_store import init_image_store, get_image_store
+from app.services.image_jobs import init_image_job_queue, close_image_job_queue, get_image_job_queue
+from app.services.image_variants import init_variant_renderer, close_variant_renderer, get_variant_renderer
+from app.services.message_writer import init_message_writer, close_message_writer, get_message_writer
+from app.services.history_cache import get_history_cache
+from app.services.sse import stream_stats
+from app.services.stream_registry import get_stream_registry
+from app.services.completion_cache import init_completion_cache, close_completion_cache, get_completion_cache
+from app.services.summarizer import init_summarizer, close_summarizer, get_summarizer
+from app.services.admission import get_admission_controller
+from app.services.sparkie_prompt import get_prompt_builder
 from app.routers import chat_router, auth_router, multimodal_router
 
 
@@ -37,19 +50,33 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
     
+    await init_message_writer()
+    logger.info("Message writer ready")
+    
     await init_minimax_service()
     logger.info("MiniMax service ready")
     
     await init_modelscope_service()
+    await init_image_store()
+    await init_variant_renderer()
+    await init_image_job_queue()
     logger.info("ModelScope image service ready")
     
+    await init_completion_cache()
+    await init_summarizer()
+    
     logger.info("Sparkie is ready to serve! ✨")
     
     yield
     
     logger.info("🐝 Sparkie Hive shutting down...")
+    await close_summarizer()
+    await close_completion_cache()
+    await close_image_job_queue()
+    await close_variant_renderer()
     await close_modelscope_service()
     await close_minimax_service()
+    await close_message_writer()
     await close_db()
     logger.info("Sparkie says goodbye! 👋")
 
@@ -92,6 +119,48 @@ async def health_check():
     }
 
 
+def require_internal(request: Request):
+    """Allow only callers holding the stats token, or loopback clients when none is configured."""
+    if settings.stats_token:
+        token = request.headers.get("X-Stats-Token", "")
+        if secrets.compare_digest(token.encode(), settings.stats_token.encode()):
+            return
+    elif request.client and request.client.host in ("127.0.0.1", "::1"):
+        return
+    raise HTTPException(status_code=403, detail="Internal endpoint")
+
+
+@app.get("/stats", tags=["Health"], dependencies=[Depends(require_internal)])
+async def runtime_stats():
+    """Internal counters of the in-process caches and queues."""
+    writer = get_message_writer()
+    completion_cache = get_completion_cache()
+    summarizer = get_summarizer()
+    return {
+        "message_writer": writer.stats() if writer else None,
+        "history_cache": get_history_cache().stats(),
+        "sse": stream_stats.stats(),
+        "streams": get_stream_registry().stats(),
+        "completion_cache": completion_cache.stats() if completion_cache else None,
+        "summarizer": summarizer.stats() if summarizer else None,
+        "prompts": get_prompt_builder().stats(),
+        "modelscope": get_modelscope_service().stats(),
+        "image_store": get_image_store().stats(),
+        "image_jobs": get_image_job_queue().stats(),
+        "image_variants": get_variant_renderer().stats(),
+        "admission": get_admission_controller().stats(),
+        "minimax_pool": get_minimax_service().pool_stats(),
+        "minimax_calls": get_minimax_service().caller.stats(),
+        "minimax_upstreams": get_minimax_service().upstreams.stats(),
+    }
+
+
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def metrics():
+    """Prometheus metrics (upstream LLM latency, token usage and errors)."""
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
 # Root endpoint - serve Next.js frontend
 from fastapi.responses import FileResponse
 
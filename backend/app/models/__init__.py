@@ -1,7 +1,6 @@
 # Models package
-from app.models.database import Base, engine, async_session
+from app.models.database import Base, engine, async_session, User, Message, Conversation
 from app.models.schemas import (
-    User, Message, Conversation,
     UserCreate, UserResponse, Token,
     ChatRequest, ChatResponse, ConversationResponse
 )
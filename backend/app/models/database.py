@@ -2,7 +2,7 @@
 Database models and connection management.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, func
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index, func, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -52,12 +52,21 @@ class Conversation(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String(200), default="New Conversation")
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Keyset pagination of a user's conversations, most recently updated first
+        Index("ix_conversations_user_updated", "user_id", "updated_at", "id"),
+    )
+    
     def __repr__(self):
         return f"<Conversation {self.id}: {self.title}>"
 
@@ -70,18 +79,71 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String(20), nullable=False)
     content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=True)
+    truncated = Column(Boolean, nullable=False, default=False, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     conversation = relationship("Conversation", back_populates="messages")
     
+    __table_args__ = (
+        # Keyset pagination of a conversation's messages in either direction
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
+    
     def __repr__(self):
         return f"<Message {self.id}: {self.role}>"
 
 
+def _add_missing_columns(sync_conn) -> set[str]:
+    """
+    Add columns and indexes introduced after a table was first created.
+    
+    Only columns that are nullable or have a server default can be added.
+    Returns the added columns as "table.column".
+    """
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    added = set()
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=sync_conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            elif not column.nullable:
+                continue
+            sync_conn.execute(text(ddl))
+            added.add(f"{table.name}.{column.name}")
+        
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+    
+    return added
+
+
 async def init_db():
     """Initialize database tables."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        added = await conn.run_sync(_add_missing_columns)
+        
+        if "conversations.message_count" in added:
+            # Backfill the denormalized counters once for existing conversations
+            await conn.execute(text(
+                "UPDATE conversations SET "
+                "message_count = (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id), "
+                "last_message_at = (SELECT MAX(created_at) FROM messages WHERE messages.conversation_id = conversations.id)"
+            ))
+        
+        # Databases that got messages.truncated before it had a server default hold NULLs
+        await conn.execute(text("UPDATE messages SET truncated = 0 WHERE truncated IS NULL"))
 
 
 async def close_db():
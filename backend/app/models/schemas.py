@@ -44,6 +44,18 @@ class ConversationResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class MessageResponse(BaseModel):
+    id: int
+    role: str
+    content: str
+    truncated: bool = False
+    created_at: datetime
     
     class Config:
         from_attributes = True
@@ -64,6 +76,24 @@ class ChatResponse(BaseModel):
     usage: Optional[dict] = None
 
 
+class BatchChatItem(BaseModel):
+    message: str = Field(..., min_length=1, max_length=10000)
+    conversation_id: Optional[int] = None
+
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(..., min_length=1, max_length=100)
+    temperature: Optional[float] = Field(None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(None, ge=1, le=4096)
+
+
+class BatchChatResult(BaseModel):
+    index: int
+    conversation_id: Optional[int] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+
+
 # Error schemas
 class ErrorResponse(BaseModel):
     error: str
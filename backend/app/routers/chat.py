@@ -1,16 +1,30 @@
 """
 Chat API endpoints - The heart of Sparkie's conversations.
 """
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-import json
 
+from app.config import settings
 from app.models.database import async_session, Conversation, Message
-from app.models.schemas import ChatRequest, ChatResponse, ConversationResponse
+from app.models.schemas import (
+    BatchChatRequest, BatchChatResult, ChatRequest, ChatResponse, ConversationResponse, MessageResponse
+)
 from app.services.minimax import get_minimax_service, MiniMaxService
-from app.services.sparkie_prompt import get_sparkie_system_prompt, get_greeting
+from app.services.sparkie_prompt import get_prompt_builder, get_greeting
+from app.services.chat_repository import ChatTurn, ChatTurnRepository, ConversationNotFoundError, get_chat_repository
+from app.services.context_builder import estimate_tokens, get_context_builder
+from app.services.sse import SSE_HEADERS, EventCounter, coalesce
+from app.services.stream_registry import ChatStream, StreamRegistry, get_stream_registry, parse_event_id
+from app.services.completion_cache import CompletionCache, get_completion_cache
+from app.services.summarizer import get_summarizer
+from app.services.history_export import HistoryExport
+from app.services.admission import AdmissionRejected, Priority, get_admission_controller
+from app.services.upstream_pool import UpstreamUnavailable
+from app.services.pagination import decode_cursor, encode_cursor, keyset_after, keyset_before, sort_key
 from app.middleware.auth import get_current_user, CurrentUser
 from loguru import logger
 
@@ -18,192 +32,523 @@ from loguru import logger
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 
+async def _prepare_turn(
+    request: ChatRequest,
+    current_user: CurrentUser,
+    repository: ChatTurnRepository
+) -> tuple[int, list[dict]]:
+    """Persist the user's message and build the message list for the model."""
+    is_creator = (current_user.username == "WeGotHeaven")
+    
+    greeting = None
+    if request.conversation_id is None:
+        greeting = get_greeting(username=current_user.username, is_creator=is_creator)
+    
+    try:
+        turn = await repository.begin_turn(
+            user_id=current_user.id,
+            conversation_id=request.conversation_id,
+            content=request.message,
+            greeting=greeting
+        )
+    except ConversationNotFoundError:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    return turn.conversation_id, _build_messages(request, current_user, turn)
+
+
+def _build_messages(request: ChatRequest, current_user: CurrentUser, turn: ChatTurn) -> list[dict]:
+    """Build the model's message list for an opened turn."""
+    is_creator = (current_user.username == "WeGotHeaven")
+    
+    # Long conversation: fold older messages into the summary in the background
+    summarizer = get_summarizer()
+    if summarizer is not None and len(turn.history) >= settings.summary_trigger_messages:
+        summarizer.schedule(turn.conversation_id)
+    
+    prompts = get_prompt_builder()
+    system_prompt = prompts.system_prompt(username=current_user.username, is_creator=is_creator)
+    return get_context_builder().build(
+        system_prompt=system_prompt.text,
+        history=turn.history,
+        max_tokens=request.max_tokens,
+        summary=turn.summary,
+        system_tokens=system_prompt.tokens,
+        context=prompts.time_context()
+    )
+
+
+def _completion_cache_key(
+    request: ChatRequest,
+    minimax_service: MiniMaxService,
+    api_messages: list[dict]
+) -> tuple[Optional[CompletionCache], Optional[str]]:
+    """Return the completion cache and key for this request, if it is cacheable."""
+    cache = get_completion_cache()
+    if cache is None or not cache.is_cacheable(request.temperature):
+        return None, None
+    key = cache.make_key(minimax_service.model, api_messages, request.temperature, request.max_tokens)
+    return cache, key
+
+
+async def _complete(
+    request: ChatRequest,
+    minimax_service: MiniMaxService,
+    api_messages: list[dict],
+    usage: Optional[dict] = None
+) -> str:
+    """
+    Full (non-streaming) reply, served from the completion cache when possible.
+    
+    `usage` is filled with the upstream token counts, and left empty on a cache hit.
+    """
+    cache, cache_key = _completion_cache_key(request, minimax_service, api_messages)
+    response_text = await cache.get(cache_key) if cache_key else None
+    if response_text is not None:
+        return response_text
+    
+    response_text = ""
+    async for chunk in minimax_service.chat(
+        messages=api_messages,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        stream=False,
+        usage=usage
+    ):
+        response_text += chunk
+    
+    if cache_key:
+        await cache.set(cache_key, response_text)
+    return response_text
+
+
+def _upstream_busy(e: Union[AdmissionRejected, UpstreamUnavailable]) -> HTTPException:
+    """503 telling the client when to retry, for shed requests or an unreachable upstream."""
+    return HTTPException(
+        status_code=503,
+        detail="Sparkie is busy right now, please retry shortly",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _stream_response(stream: ChatStream, after_seq: int = 0) -> StreamingResponse:
+    """SSE response that follows a registered chat stream from `after_seq`."""
+    async def generate():
+        events = EventCounter()
+        try:
+            async for seq, payload in stream.subscribe(after_seq):
+                yield events.encode(payload, event_id=stream.event_id(seq))
+        finally:
+            events.close()
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.post("", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
     current_user: CurrentUser = Depends(get_current_user),
-    minimax_service: MiniMaxService = Depends(get_minimax_service)
+    minimax_service: MiniMaxService = Depends(get_minimax_service),
+    repository: ChatTurnRepository = Depends(get_chat_repository)
 ):
     """Send a message to Sparkie and get a response (non-streaming)."""
     try:
-        # Get or create conversation
-        conversation_id = request.conversation_id
-        if conversation_id is None:
-            conversation = Conversation(user_id=current_user.id, title="Chat with Sparkie")
-            async with async_session() as session:
-                session.add(conversation)
-                await session.commit()
-                await session.refresh(conversation)
-            conversation_id = conversation.id
+        # Admit before storing anything, so a shed request can simply be retried
+        async with get_admission_controller().slot(Priority.STANDARD):
+            conversation_id, api_messages = await _prepare_turn(request, current_user, repository)
             
-            # Add greeting
-            is_creator = (current_user.username == "WeGotHeaven")
-            greeting = get_greeting(username=current_user.username, is_creator=is_creator)
-            msg = Message(conversation_id=conversation_id, role="assistant", content=greeting)
-            async with async_session() as session:
-                session.add(msg)
-                await session.commit()
-        
-        # Add user message
-        user_msg = Message(conversation_id=conversation_id, role="user", content=request.message)
-        async with async_session() as session:
-            session.add(user_msg)
-            await session.commit()
-        
-        # Get conversation history
-        async with async_session() as session:
-            result = await session.execute(
-                select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at.asc())
-            )
-            messages = list(result.scalars().all())
-        
-        # Build messages for API
-        is_creator = (current_user.username == "WeGotHeaven")
-        system_prompt = get_sparkie_system_prompt(username=current_user.username, is_creator=is_creator)
-        
-        api_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages[-20:]:
-            api_messages.append({"role": msg.role, "content": msg.content})
-        
-        # Get AI response
-        response_text = ""
-        async for chunk in minimax_service.chat(
-            messages=api_messages,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=False
-        ):
-            response_text += chunk
+            # Get AI response
+            usage: dict = {}
+            response_text = await _complete(request, minimax_service, api_messages, usage)
         
         # Save assistant message
-        assistant_msg = Message(conversation_id=conversation_id, role="assistant", content=response_text)
-        async with async_session() as session:
-            session.add(assistant_msg)
-            await session.commit()
+        await repository.save_reply(conversation_id, response_text)
         
         logger.info(f"Chat completed for user {current_user.username}")
         
-        return ChatResponse(conversation_id=conversation_id, message=response_text)
+        return ChatResponse(conversation_id=conversation_id, message=response_text, usage=usage or None)
         
     except HTTPException:
         raise
+    except (AdmissionRejected, UpstreamUnavailable) as e:
+        raise _upstream_busy(e)
     except Exception as e:
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to process chat: {str(e)}")
 
 
+@router.post("/batch")
+async def chat_batch(
+    request: BatchChatRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    minimax_service: MiniMaxService = Depends(get_minimax_service),
+    repository: ChatTurnRepository = Depends(get_chat_repository)
+):
+    """
+    Send many independent messages to Sparkie in one request.
+    
+    All user messages are stored in one transaction, then up to
+    `batch_chat_concurrency` completions run at once. Results are streamed
+    as NDJSON in completion order, one BatchChatResult per line; `index`
+    refers to the item's position in the request. A failed item carries
+    `error` and does not affect the others.
+    """
+    conversation_ids = [item.conversation_id for item in request.items if item.conversation_id is not None]
+    if len(conversation_ids) != len(set(conversation_ids)):
+        raise HTTPException(status_code=400, detail="A conversation may appear only once per batch")
+    
+    is_creator = (current_user.username == "WeGotHeaven")
+    try:
+        turns = await repository.begin_turns(
+            user_id=current_user.id,
+            prompts=[
+                (
+                    item.conversation_id,
+                    item.message,
+                    get_greeting(username=current_user.username, is_creator=is_creator)
+                    if item.conversation_id is None else None
+                )
+                for item in request.items
+            ]
+        )
+    except Exception as e:
+        logger.error(f"Batch chat error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to process batch: {str(e)}")
+    
+    semaphore = asyncio.Semaphore(settings.batch_chat_concurrency)
+    admission = get_admission_controller()
+    
+    async def run(index: int, turn: Optional[ChatTurn]) -> BatchChatResult:
+        item = request.items[index]
+        if turn is None:
+            return BatchChatResult(index=index, conversation_id=item.conversation_id, error="Conversation not found")
+        
+        item_request = ChatRequest(
+            message=item.message,
+            conversation_id=turn.conversation_id,
+            stream=False,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens
+        )
+        try:
+            async with semaphore, admission.slot(Priority.BATCH):
+                response_text = await _complete(
+                    item_request, minimax_service, _build_messages(item_request, current_user, turn)
+                )
+            # Queued on the message writer, which inserts replies in batches
+            await repository.save_reply(turn.conversation_id, response_text)
+        except Exception as e:
+            logger.error(f"Batch chat item {index} error: {e}")
+            return BatchChatResult(index=index, conversation_id=turn.conversation_id, error=str(e))
+        
+        return BatchChatResult(index=index, conversation_id=turn.conversation_id, message=response_text)
+    
+    async def generate():
+        tasks = [asyncio.create_task(run(index, turn)) for index, turn in enumerate(turns)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield result.model_dump_json() + "\n"
+        finally:
+            # Client went away: stop the completions nobody will read
+            for task in tasks:
+                task.cancel()
+    
+    logger.info(f"Batch chat of {len(turns)} items for user {current_user.username}")
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @router.post("/stream")
 async def chat_stream(
     request: ChatRequest,
     current_user: CurrentUser = Depends(get_current_user),
-    minimax_service: MiniMaxService = Depends(get_minimax_service)
+    minimax_service: MiniMaxService = Depends(get_minimax_service),
+    repository: ChatTurnRepository = Depends(get_chat_repository),
+    registry: StreamRegistry = Depends(get_stream_registry)
 ):
-    """Send a message to Sparkie and stream the response."""
+    """
+    Send a message to Sparkie and stream the response.
+    
+    The generation is registered under the conversation, and every event
+    carries an `id` so a dropped client can resume via GET /chat/stream/{id}.
+    """
+    if not request.stream:
+        raise HTTPException(status_code=400, detail="stream=true is required")
+    
+    # Interactive streams are admitted ahead of plain and batch requests
     try:
-        if not request.stream:
-            raise HTTPException(status_code=400, detail="stream=true is required")
-        
-        # Get or create conversation
-        conversation_id = request.conversation_id
-        if conversation_id is None:
-            conversation = Conversation(user_id=current_user.id, title="Chat with Sparkie")
-            async with async_session() as session:
-                session.add(conversation)
-                await session.commit()
-                await session.refresh(conversation)
-            conversation_id = conversation.id
-            
-            is_creator = (current_user.username == "WeGotHeaven")
-            greeting = get_greeting(username=current_user.username, is_creator=is_creator)
-            msg = Message(conversation_id=conversation_id, role="assistant", content=greeting)
-            async with async_session() as session:
-                session.add(msg)
-                await session.commit()
-        
-        # Add user message
-        user_msg = Message(conversation_id=conversation_id, role="user", content=request.message)
-        async with async_session() as session:
-            session.add(user_msg)
-            await session.commit()
-        
-        # Get history
-        async with async_session() as session:
-            result = await session.execute(
-                select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at.asc())
-            )
-            messages = list(result.scalars().all())
+        ticket = await get_admission_controller().acquire(Priority.INTERACTIVE)
+    except AdmissionRejected as e:
+        raise _upstream_busy(e)
+    
+    try:
+        conversation_id, api_messages = await _prepare_turn(request, current_user, repository)
         
-        is_creator = (current_user.username == "WeGotHeaven")
-        system_prompt = get_sparkie_system_prompt(username=current_user.username, is_creator=is_creator)
+        cache, cache_key = _completion_cache_key(request, minimax_service, api_messages)
+        cached_reply = await cache.get(cache_key) if cache_key else None
+        if cached_reply is not None:
+            ticket.release()
         
-        api_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages[-20:]:
-            api_messages.append({"role": msg.role, "content": msg.content})
+        parts = []
+        usage: dict = {}
         
-        async def generate():
-            response_text = ""
+        async def upstream():
             async for chunk in minimax_service.chat(
                 messages=api_messages,
                 temperature=request.temperature,
                 max_tokens=request.max_tokens,
-                stream=True
+                stream=True,
+                usage=usage
             ):
-                response_text += chunk
-                yield f"data: {json.dumps({'chunk': chunk, 'done': False})}\n\n"
+                parts.append(chunk)
+                yield chunk
+        
+        async def replay_cached():
+            # Cache hit: a synthetic stream of frame-sized pieces, no upstream call
+            step = settings.sse_coalesce_max_bytes
+            for start in range(0, len(cached_reply), step):
+                parts.append(cached_reply[start:start + step])
+                yield parts[-1]
+        
+        async def produce(stream: ChatStream):
+            source = replay_cached() if cached_reply is not None else upstream()
+            try:
+                async for text in coalesce(
+                    source,
+                    interval=settings.sse_coalesce_interval_ms / 1000,
+                    max_bytes=settings.sse_coalesce_max_bytes
+                ):
+                    stream.publish({"chunk": text, "done": False})
+            except asyncio.CancelledError:
+                # Every client disconnected: keep what was generated, marked as truncated
+                partial = "".join(parts)
+                if cached_reply is None:
+                    reply_budget = request.max_tokens or settings.context_default_reply_tokens
+                    registry.tokens_budget_released += max(reply_budget - estimate_tokens(partial), 0)
+                if partial:
+                    await repository.save_reply(conversation_id, partial, truncated=True)
+                raise
+            finally:
+                ticket.release()
             
-            # Save assistant message
-            assistant_msg = Message(conversation_id=conversation_id, role="assistant", content=response_text)
-            async with async_session() as session:
-                session.add(assistant_msg)
-                await session.commit()
+            # Queue assistant message; the writer persists it off the stream
+            response_text = "".join(parts)
+            await repository.save_reply(conversation_id, response_text)
+            if cache_key and cached_reply is None:
+                await cache.set(cache_key, response_text)
             
-            yield f"data: {json.dumps({'chunk': '', 'done': True, 'conversation_id': conversation_id})}\n\n"
+            done = {"chunk": "", "done": True, "conversation_id": conversation_id}
+            if usage:
+                done["usage"] = usage
+            stream.publish(done)
         
-        return generate()
+        stream = registry.start(conversation_id, current_user.id, produce)
+        return _stream_response(stream)
         
     except HTTPException:
+        ticket.release()
         raise
     except Exception as e:
+        ticket.release()
         logger.error(f"Streaming error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to stream response: {str(e)}")
 
 
+@router.get("/stream/{conversation_id}")
+async def resume_chat_stream(
+    conversation_id: int,
+    last_event_id: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    registry: StreamRegistry = Depends(get_stream_registry)
+):
+    """
+    Attach to the latest generation of a conversation without calling MiniMax again.
+    
+    With a `Last-Event-ID` header from the same turn, only events after it
+    are replayed; otherwise the reply is replayed from the start. Several
+    clients may follow the same generation at once.
+    """
+    stream = registry.get(conversation_id)
+    if stream is None or stream.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="No active stream for this conversation")
+    
+    after_seq = 0
+    last_event = parse_event_id(last_event_id)
+    if last_event is not None:
+        event_conversation, event_turn, event_seq = last_event
+        if event_conversation == conversation_id and event_turn == stream.turn_id:
+            after_seq = event_seq
+            registry.resumes += 1
+    
+    return _stream_response(stream, after_seq)
+
+
 @router.get("/conversations", response_model=list[ConversationResponse])
 async def get_conversations(
+    response: Response,
     limit: int = Query(50, ge=1, le=100),
-    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
     current_user: CurrentUser = Depends(get_current_user)
 ):
-    """Get all conversations for the current user."""
+    """
+    Get the current user's conversations, most recently updated first.
+    
+    Paginated by (updated_at, id): when more conversations remain, the
+    `X-Next-Cursor` response header holds the cursor for the next page.
+    """
     try:
+        query = (
+            select(Conversation, sort_key(Conversation.updated_at).label("sort_key"))
+            .where(Conversation.user_id == current_user.id)
+        )
+        if cursor:
+            try:
+                cursor_value, cursor_id = decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.where(keyset_before(Conversation.updated_at, Conversation.id, cursor_value, cursor_id))
+        
         async with async_session() as session:
             result = await session.execute(
-                select(Conversation)
-                .where(Conversation.user_id == current_user.id)
-                .order_by(Conversation.updated_at.desc())
-                .offset(offset)
-                .limit(limit)
+                query
+                .order_by(sort_key(Conversation.updated_at).desc(), Conversation.id.desc())
+                .limit(limit + 1)
             )
-            conversations = list(result.scalars().all())
+            rows = result.all()
         
-        result = []
-        for conv in conversations:
-            async with async_session() as session:
-                count_result = await session.execute(
-                    select("count(Message.id)").where(Message.conversation_id == conv.id)
-                )
-                msg_count = count_result.scalar() or 0
-            
-            result.append(ConversationResponse(
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_conversation, last_key = rows[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last_key, last_conversation.id)
+        
+        return [
+            ConversationResponse(
                 id=conv.id,
                 title=conv.title,
                 created_at=conv.created_at,
                 updated_at=conv.updated_at,
-                message_count=msg_count
-            ))
-        
-        return result
+                message_count=conv.message_count or 0,
+                last_message_at=conv.last_message_at
+            )
+            for conv, _ in rows
+        ]
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting conversations: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch conversations")
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=list[MessageResponse])
+async def get_messages(
+    conversation_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    order: Literal["desc", "asc"] = Query("desc", description="desc: newest first, asc: oldest first"),
+    stream: bool = Query(False, description="Stream every message from the cursor on as NDJSON"),
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Get a conversation's messages, one page at a time or as an NDJSON stream.
+    
+    Paginated by (created_at, id) in the requested order: when more messages
+    remain, the `X-Next-Cursor` response header holds the cursor for the next
+    page. With `stream=true` the limit is ignored and every remaining message
+    is written as one JSON object per line, read from the database in
+    batches so long conversations are never loaded into memory at once.
+    """
+    try:
+        query = select(
+            Message.id,
+            Message.role,
+            Message.content,
+            Message.truncated,
+            Message.created_at,
+            sort_key(Message.created_at).label("sort_key")
+        ).where(Message.conversation_id == conversation_id)
+        keyset = keyset_before if order == "desc" else keyset_after
+        if cursor:
+            try:
+                cursor_value, cursor_id = decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.where(keyset(Message.created_at, Message.id, cursor_value, cursor_id))
+        
+        if order == "desc":
+            query = query.order_by(sort_key(Message.created_at).desc(), Message.id.desc())
+        else:
+            query = query.order_by(sort_key(Message.created_at).asc(), Message.id.asc())
+        
+        async with async_session() as session:
+            result = await session.execute(
+                select(Conversation.id)
+                .where(Conversation.id == conversation_id, Conversation.user_id == current_user.id)
+            )
+            if result.scalar_one_or_none() is None:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            
+            if not stream:
+                result = await session.execute(query.limit(limit + 1))
+                rows = result.all()
+        
+        if stream:
+            return StreamingResponse(_stream_messages(query, keyset), media_type="application/x-ndjson")
+        
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].sort_key, rows[-1].id)
+        
+        return [MessageResponse.model_validate(row) for row in rows]
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting messages: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch messages")
+
+
+async def _stream_messages(query, keyset):
+    """
+    NDJSON lines for every row of `query`, read in batches that each resume
+    after the previous batch's last row via `keyset`. Every batch runs in a
+    session of its own, so no read transaction (and no SQLite lock blocking
+    writers) stays open while a slow client drains the response.
+    """
+    batch_size = settings.message_stream_batch_size
+    page = query.limit(batch_size)
+    try:
+        while True:
+            async with async_session() as session:
+                rows = (await session.execute(page)).all()
+            if rows:
+                yield "".join(
+                    MessageResponse.model_validate(row).model_dump_json() + "\n"
+                    for row in rows
+                )
+            if len(rows) < batch_size:
+                break
+            last = rows[-1]
+            page = query.where(keyset(Message.created_at, Message.id, last.sort_key, last.id)).limit(batch_size)
+    except Exception as e:
+        # Headers are already sent; aborting leaves the client with a cut-off body
+        logger.error(f"Error streaming messages: {e}")
+        raise
+
+
+@router.get("/export")
+async def export_history(current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Download the current user's conversations and messages as gzip-compressed NDJSON.
+    
+    Each line is a JSON object with a `type` of "user", "conversation" or
+    "message". The file is streamed while it is produced.
+    """
+    export = HistoryExport(current_user.id, batch_size=settings.export_batch_size)
+    filename = f"sparkie-history-{current_user.username}.ndjson.gz"
+    return StreamingResponse(
+        export.stream(),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
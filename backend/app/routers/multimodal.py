@@ -3,11 +3,23 @@ Multimodal API endpoints for Sparkie.
 Includes image generation, video stubs, and TTS stubs.
 """
 import re
-from fastapi import APIRouter, HTTPException, Depends, status
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Literal, Optional
 
 from app.models.schemas import ErrorResponse
+from app.services.image_jobs import (
+    ImageGenerationFailed,
+    ImageJob,
+    ImageJobRejected,
+    generate_stored_image,
+    get_image_job_queue
+)
+from app.services.image_store import BLOB_NAME, StoredImage, get_image_store
+from app.services.image_variants import get_variant_renderer
+from app.services.sse import SSE_HEADERS, encode_event
 from app.services.modelscope_image import get_modelscope_service, ModelScopeImageService
 from app.middleware.auth import get_current_user, CurrentUser
 from loguru import logger
@@ -15,6 +27,11 @@ from loguru import logger
 
 router = APIRouter(prefix="/generate", tags=["Multimodal"])
 
+# Stored images never change under their URL
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+JOB_EVENTS_KEEPALIVE_SECONDS = 15.0
+
 
 # Request/Response Schemas
 class ImageGenerateRequest(BaseModel):
@@ -41,12 +58,30 @@ class ImageGenerateResponse(BaseModel):
     """Response schema for image generation."""
     success: bool
     url: Optional[str] = None
+    webp_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
     data_url: Optional[str] = None
     message: str
     metadata: Optional[dict] = None
     error: Optional[str] = None
 
 
+class ImageJobResponse(BaseModel):
+    """Status of a background image generation job."""
+    job_id: str
+    status: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    url: Optional[str] = None
+    webp_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    metadata: Optional[dict] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    status_url: str
+    events_url: str
+
+
 # Image generation patterns for auto-detection in chat
 IMAGE_PATTERNS = [
     r"generate\s+(an?\s+)?image\s+(of\s+|with\s+)?",
@@ -97,6 +132,120 @@ def detect_image_request(text: str) -> Optional[str]:
     return None
 
 
+VALID_SIZES = ["512x512", "768x768", "1024x1024", "1024x768", "768x1024"]
+
+
+def _validate_size(size: str) -> None:
+    if size not in VALID_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid size. Must be one of: {', '.join(VALID_SIZES)}"
+        )
+
+
+def _accept_q(accept: str, media_type: str) -> float:
+    """Quality an Accept header gives `media_type`, from its most specific matching range."""
+    main_type = media_type.split("/", 1)[0]
+    q, specificity = 0.0, -1
+    for part in accept.split(","):
+        fields = part.split(";")
+        range_ = fields[0].strip().lower()
+        if range_ == media_type:
+            rank = 2
+        elif range_ == f"{main_type}/*":
+            rank = 1
+        elif range_ == "*/*":
+            rank = 0
+        else:
+            continue
+        if rank <= specificity:
+            continue
+        q, specificity = 1.0, rank
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+    return q
+
+
+def _negotiate_image(accept: Optional[str], image: StoredImage) -> Optional[str]:
+    """
+    Whether a client would rather have the image bytes than JSON.
+    
+    Returns "webp" or "original" when an image type is strictly preferred
+    over application/json, None otherwise (so `*/*` and no Accept keep JSON).
+    """
+    if not accept:
+        return None
+    json_q = _accept_q(accept, "application/json")
+    original_q = _accept_q(accept, image.media_type)
+    webp_q = 0.0
+    if image.media_type != "image/webp" and get_variant_renderer().available:
+        webp_q = _accept_q(accept, "image/webp")
+    if max(original_q, webp_q) <= json_q:
+        return None
+    return "webp" if webp_q >= original_q else "original"
+
+
+def _etag_matches(if_none_match: Optional[str], digest: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+    return digest in tags or "*" in tags
+
+
+async def _image_variant(image: StoredImage, variant: str) -> Optional[StoredImage]:
+    """A variant of a stored image, rendering it first if needed."""
+    if not await get_variant_renderer().ensure(image):
+        return None
+    return get_image_store().variant(image.name, variant)
+
+
+def _file_response(image: StoredImage, if_none_match: Optional[str] = None, headers: Optional[dict] = None) -> Response:
+    headers = {"ETag": f'"{image.digest}"', "Cache-Control": IMAGE_CACHE_CONTROL, **(headers or {})}
+    if _etag_matches(if_none_match, image.digest):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(image.path, media_type=image.media_type, headers=headers)
+
+
+def _image_urls(http_request: Request, image: StoredImage) -> dict:
+    url = str(http_request.url_for("get_image_file", name=image.name))
+    if not get_variant_renderer().available:
+        return {"url": url, "webp_url": None, "thumbnail_url": None}
+    return {"url": url, "webp_url": f"{url}?variant=webp", "thumbnail_url": f"{url}?variant=thumb"}
+
+
+async def _binary_response(http_request: Request, image: StoredImage, preferred: str) -> Response:
+    """The image bytes themselves, for clients that asked for an image type."""
+    urls = _image_urls(http_request, image)
+    url = urls["url"]
+    if preferred == "webp":
+        variant = await _image_variant(image, "webp")
+        if variant is not None:
+            image, url = variant, urls["webp_url"]
+    return _file_response(image, headers={"Content-Location": url, "Vary": "Accept"})
+
+
+def _image_response(
+    http_request: Request,
+    image: StoredImage,
+    metadata: dict,
+    cached: bool
+) -> ImageGenerateResponse:
+    """Success response pointing at a stored image."""
+    return ImageGenerateResponse(
+        success=True,
+        **_image_urls(http_request, image),
+        data_url=None,
+        message="Image generated successfully! 🐝✨",
+        metadata={**metadata, "cached": cached, "bytes": image.size},
+        error=None
+    )
+
+
 @router.post(
     "/image",
     response_model=ImageGenerateResponse,
@@ -111,6 +260,7 @@ def detect_image_request(text: str) -> Optional[str]:
 )
 async def generate_image(
     request: ImageGenerateRequest,
+    http_request: Request,
     current_user: CurrentUser = Depends(get_current_user),
     modelscope_service: ModelScopeImageService = Depends(get_modelscope_service)
 ):
@@ -125,50 +275,37 @@ async def generate_image(
     - **prompt**: Text description of the image (required)
     - **size**: Image dimensions (default: 1024x1024)
     - **steps**: Inference steps (default: 9, recommended for Turbo)
+    
+    Images are kept in the image store and returned as a `url`; asking again
+    for the same prompt, size and steps serves the stored image without
+    generating a new one.
+    
+    Clients that prefer an image type over JSON in `Accept` (e.g.
+    `Accept: image/webp`) get the image bytes directly, with the stored
+    file's URL in `Content-Location`.
     """
     try:
         logger.info(f"Image generation request from user {current_user.username}: {request.prompt[:100]}...")
         
-        # Validate size
-        valid_sizes = ["512x512", "768x768", "1024x1024", "1024x768", "768x1024"]
-        if request.size not in valid_sizes:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid size. Must be one of: {', '.join(valid_sizes)}"
-            )
+        _validate_size(request.size)
         
-        # Generate image
-        result = await modelscope_service.generate_image(
-            prompt=request.prompt,
-            size=request.size,
-            steps=request.steps
-        )
-        
-        if result["success"]:
-            # Get base64 data URL for frontend
-            data_url = await modelscope_service.generate_image_base64(
-                prompt=request.prompt,
-                size=request.size,
-                steps=request.steps
-            )
-            
-            logger.info(f"Image generated successfully for user {current_user.username}")
-            
-            return ImageGenerateResponse(
-                success=True,
-                url=result.get("url"),
-                data_url=data_url,
-                message="Image generated successfully! 🐝✨",
-                metadata=result.get("metadata"),
-                error=None
+        # Served from the image store when the same image was made before
+        try:
+            image, metadata, cached = await generate_stored_image(
+                modelscope_service, request.prompt, request.size, request.steps, current_user.id
             )
-        else:
+        except ImageGenerationFailed as e:
+            result = e.result
             # Check if it's a rate limit or auth error
             error_code = result.get("error", "Unknown")
             if error_code in ["Rate limited", "Invalid API key"]:
+                headers = None
+                if result.get("retry_after"):
+                    headers = {"Retry-After": str(result["retry_after"])}
                 raise HTTPException(
                     status_code=429 if error_code == "Rate limited" else 401,
-                    detail=result["message"]
+                    detail=result["message"],
+                    headers=headers
                 )
             
             logger.warning(f"Image generation failed for user {current_user.username}: {result.get('message')}")
@@ -181,7 +318,12 @@ async def generate_image(
                 metadata=None,
                 error=result.get("error")
             )
-            
+        
+        logger.info(f"Image {'served from store' if cached else 'generated successfully'} for user {current_user.username}")
+        preferred = _negotiate_image(http_request.headers.get("accept"), image)
+        if preferred is not None:
+            return await _binary_response(http_request, image, preferred)
+        return _image_response(http_request, image, metadata, cached=cached)
     except HTTPException:
         raise
     except Exception as e:
@@ -192,6 +334,184 @@ async def generate_image(
         )
 
 
+def _job_response(http_request: Request, job: ImageJob) -> ImageJobResponse:
+    urls = {}
+    if job.image is not None:
+        urls = _image_urls(http_request, job.image)
+    return ImageJobResponse(
+        job_id=job.id,
+        status=job.status,
+        created_at=datetime.fromtimestamp(job.created_at),
+        finished_at=datetime.fromtimestamp(job.finished_at) if job.finished_at else None,
+        **urls,
+        metadata=job.metadata,
+        message=job.message,
+        error=job.error,
+        status_url=str(http_request.url_for("get_image_job", job_id=job.id)),
+        events_url=str(http_request.url_for("follow_image_job", job_id=job.id))
+    )
+
+
+def _get_job(job_id: str, current_user: CurrentUser) -> ImageJob:
+    job = get_image_job_queue().get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Image job not found")
+    return job
+
+
+@router.post(
+    "/image/jobs",
+    response_model=ImageJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={
+        400: {"model": ErrorResponse},
+        429: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
+    },
+    summary="Submit Image Job",
+    description="Queue an image generation and return at once with a job to poll or follow"
+)
+async def submit_image_job(
+    request: ImageGenerateRequest,
+    http_request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+    modelscope_service: ModelScopeImageService = Depends(get_modelscope_service)
+):
+    """
+    Queue an image generation.
+    
+    Takes the same body as `POST /generate/image` but answers immediately
+    with `202 Accepted`. Poll `status_url`, or follow `events_url` (SSE)
+    until the status is `succeeded` (with the image `url`) or `failed`.
+    """
+    _validate_size(request.size)
+    if not modelscope_service.api_key:
+        raise HTTPException(status_code=503, detail="Image generation is not configured")
+    
+    try:
+        job = get_image_job_queue().submit(current_user.id, request.prompt, request.size, request.steps)
+    except ImageJobRejected as e:
+        if e.user_limit:
+            raise HTTPException(status_code=429, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    logger.info(f"Image job {job.id} queued for user {current_user.username}")
+    return _job_response(http_request, job)
+
+
+@router.get(
+    "/image/jobs/{job_id}",
+    response_model=ImageJobResponse,
+    responses={404: {"model": ErrorResponse}},
+    summary="Get Image Job",
+    description="Current status of an image generation job"
+)
+async def get_image_job(
+    job_id: str,
+    http_request: Request,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Current status of one of your image jobs (kept for IMAGE_JOB_RESULT_TTL_SECONDS after it finishes).
+    
+    Once the job has succeeded, an `Accept` header preferring an image type
+    gets the image bytes instead, as with `POST /generate/image`.
+    """
+    job = _get_job(job_id, current_user)
+    if job.status == ImageJob.SUCCEEDED:
+        preferred = _negotiate_image(http_request.headers.get("accept"), job.image)
+        if preferred is not None:
+            return await _binary_response(http_request, job.image, preferred)
+    return _job_response(http_request, job)
+
+
+@router.get(
+    "/image/jobs/{job_id}/events",
+    responses={404: {"model": ErrorResponse}},
+    summary="Follow Image Job",
+    description="Server-Sent Events with the job status on every change"
+)
+async def follow_image_job(
+    job_id: str,
+    http_request: Request,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Stream the job status as SSE.
+    
+    Sends the current status at once and again on every change; the stream
+    ends after `succeeded` or `failed`. A comment line is sent every
+    `JOB_EVENTS_KEEPALIVE_SECONDS` so proxies keep the connection open.
+    """
+    job = _get_job(job_id, current_user)
+    
+    async def generate():
+        version = -1
+        while True:
+            if job.version != version:
+                version = job.version
+                yield encode_event(_job_response(http_request, job).model_dump(mode="json"))
+                if job.finished:
+                    return
+            elif not await job.wait_for_change(version, timeout=JOB_EVENTS_KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+    
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get(
+    "/image/files/{name}",
+    response_class=FileResponse,
+    responses={304: {"description": "Not modified"}, 404: {"model": ErrorResponse}},
+    summary="Get Generated Image",
+    description="Serve a generated image from the image store"
+)
+async def get_image_file(
+    name: str,
+    variant: Optional[Literal["webp", "thumb"]] = None,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Serve a stored image.
+    
+    File names are the SHA-256 of the image bytes, so a URL never changes
+    content: responses carry the hash as ETag and may be cached for a year.
+    Unlike the other multimodal routes this one (variants included) is
+    deliberately unauthenticated: browsers load these URLs in <img> tags,
+    which cannot send a bearer token. There is no access control at all:
+    generations are cached by prompt, size and steps, so every user who
+    submits the same parameters is handed the same URL. Treat these URLs,
+    and the images behind them, as public.
+    
+    `?variant=webp` serves a full-size WebP and `?variant=thumb` a WebP
+    thumbnail, rendered on first request if they are not ready yet. Without
+    a variant, clients that accept image/webp get the WebP once it exists.
+    """
+    image = get_image_store().blob(name) if BLOB_NAME.match(name) else None
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    if variant is not None:
+        image = await _image_variant(image, variant)
+        if image is None:
+            raise HTTPException(status_code=404, detail="Image variant not available")
+        return _file_response(image, if_none_match)
+    
+    renderer = get_variant_renderer()
+    if not renderer.available:
+        return _file_response(image, if_none_match)
+    # Only for clients naming image/webp (browsers do; `*/*` alone keeps the
+    # original), and only once rendered, so the original is never held up
+    accept = (accept or "").lower()
+    webp = None
+    if image.media_type != "image/webp" and "image/webp" in accept and _accept_q(accept, "image/webp") > 0:
+        webp = get_image_store().variant(image.name, "webp")
+        if webp is None:
+            renderer.schedule(image)
+    return _file_response(webp or image, if_none_match, headers={"Vary": "Accept"})
+
+
 @router.get(
     "/image/sizes",
     response_model=dict,
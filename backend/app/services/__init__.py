@@ -1,5 +1,10 @@
 # Services package
-from app.services.sparkie_prompt import get_sparkie_system_prompt, get_greeting
+from app.services.sparkie_prompt import (
+    PromptBuilder,
+    get_prompt_builder,
+    get_sparkie_system_prompt,
+    get_greeting
+)
 from app.services.minimax import MiniMaxService, get_minimax_service
 from app.services.modelscope_image import (
     ModelScopeImageService,
@@ -7,8 +12,11 @@ from app.services.modelscope_image import (
     init_modelscope_service,
     close_modelscope_service
 )
+from app.services.chat_repository import ChatTurnRepository, get_chat_repository
 
 __all__ = [
+    "PromptBuilder",
+    "get_prompt_builder",
     "get_sparkie_system_prompt",
     "get_greeting",
     "MiniMaxService",
@@ -17,4 +25,6 @@ __all__ = [
     "get_modelscope_service",
     "init_modelscope_service",
     "close_modelscope_service",
+    "ChatTurnRepository",
+    "get_chat_repository",
 ]
@@ -0,0 +1,176 @@
+"""
+Admission control for upstream MiniMax calls.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Optional
+
+from app.config import settings
+
+
+class Priority(IntEnum):
+    """Admission lanes; lower values are admitted first."""
+    INTERACTIVE = 0
+    STANDARD = 1
+    BATCH = 2
+
+
+class AdmissionRejected(Exception):
+    """The upstream is saturated; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int, reason: str = "queue full"):
+        super().__init__(f"Upstream busy ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionTicket:
+    """A held upstream slot. `release` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """
+    Caps concurrent upstream calls and queues the excess by priority.
+
+    At most `max_in_flight` callers hold a slot at once. Others wait in a
+    priority queue (interactive streaming ahead of plain chat ahead of
+    batch and background work, FIFO within a lane) of at most `max_queue`
+    entries. A caller that finds the queue full, or waits longer than
+    `queue_timeout` seconds, is rejected at once with an estimated
+    Retry-After rather than piling another request onto a slow upstream.
+    """
+
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 128, queue_timeout: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_wait_ms = 0.0
+        self._total_wait_ms = 0.0
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._avg_hold = 1.0
+
+    async def acquire(self, priority: Priority = Priority.STANDARD) -> AdmissionTicket:
+        """
+        Wait for an upstream slot.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait timed out
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return self._admit(0.0)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (int(priority), next(self._order), future)
+        heapq.heappush(self._waiters, entry)
+        started = loop.time()
+
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release(None)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                self.rejected += 1
+                raise AdmissionRejected(self.retry_after(), reason="queue timeout") from None
+            raise
+
+        return self._admit((loop.time() - started) * 1000)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.STANDARD):
+        """Hold an upstream slot for the duration of the block."""
+        ticket = await self.acquire(priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _admit(self, wait_ms: float) -> AdmissionTicket:
+        self.admitted += 1
+        self._total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        return AdmissionTicket(self)
+
+    def _release(self, held: Optional[float]) -> None:
+        if held is not None:
+            self._avg_hold += 0.1 * (held - self._avg_hold)
+        # Hand the slot straight to the next live waiter, if any
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog is expected to clear, clamped to 1-60."""
+        backlog = (len(self._waiters) + 1) / self.max_in_flight
+        return min(max(math.ceil(backlog * self._avg_hold), 1), 60)
+
+    def stats(self) -> dict:
+        queued = {lane.name.lower(): 0 for lane in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[Priority(priority).name.lower()] += 1
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": sum(queued.values()),
+            "queue_capacity": self.max_queue,
+            "queued": queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self._total_wait_ms / self.admitted, 3) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "avg_hold_ms": round(self._avg_hold * 1000, 3),
+        }
+
+
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get or create the upstream admission controller singleton."""
+    global _admission_controller
+    if _admission_controller is None:
+        _admission_controller = AdmissionController(
+            max_in_flight=settings.upstream_max_in_flight,
+            max_queue=settings.upstream_max_queue,
+            queue_timeout=settings.upstream_queue_timeout_seconds
+        )
+    return _admission_controller
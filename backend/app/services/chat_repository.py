@@ -0,0 +1,317 @@
+"""
+Chat turn persistence - one unit of work per conversation turn.
+"""
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import func, insert, select, update
+
+from app.models.database import async_session, Conversation, Message
+from app.services.history_cache import ConversationHistoryCache, HistoryEntry, get_history_cache
+from app.services.context_builder import estimate_tokens
+from app.services.message_writer import bump_message_counters, get_message_writer
+
+
+class ConversationNotFoundError(LookupError):
+    """The conversation does not exist or belongs to another user."""
+
+
+@dataclass
+class ChatTurn:
+    """Result of opening a chat turn: the conversation and its recent history."""
+    conversation_id: int
+    history: list[HistoryEntry] = field(default_factory=list)
+    summary: Optional[str] = None
+
+
+class ChatTurnRepository:
+    """
+    Groups the database work of a chat turn into as few transactions as possible.
+
+    A turn used to open a fresh session (and commit) for the conversation,
+    the greeting, the user message, the history read and the assistant reply.
+    Here everything before the model call happens in one transaction and
+    the reply is written in a second one, handed to the write-behind
+    MessageWriter when it is running. Recent history is served from the
+    ConversationHistoryCache; only a miss reads the tail of the conversation.
+    """
+
+    def __init__(
+        self,
+        session_factory=async_session,
+        history_cache: Optional[ConversationHistoryCache] = None
+    ):
+        self.session_factory = session_factory
+        self.history_cache = history_cache or get_history_cache()
+
+    async def begin_turn(
+        self,
+        user_id: int,
+        conversation_id: Optional[int],
+        content: str,
+        greeting: Optional[str] = None,
+        title: str = "Chat with Sparkie"
+    ) -> ChatTurn:
+        """
+        Create the conversation if needed, store the user message and read history.
+
+        Args:
+            user_id: Owner of the conversation
+            conversation_id: Existing conversation, or None to start a new one
+            content: The user's message
+            greeting: Assistant greeting stored first in a new conversation
+            title: Title for a new conversation
+
+        Returns:
+            ChatTurn with the conversation id, its rolling summary and the
+            messages after it in order
+
+        Raises:
+            ConversationNotFoundError: If `conversation_id` is not the user's
+        """
+        cache = self.history_cache
+        new_messages: list[HistoryEntry] = []
+        history: Optional[list[HistoryEntry]] = None
+        summary: Optional[str] = None
+        cache_hit = False
+
+        if conversation_id is not None:
+            await self._wait_for_replies([conversation_id])
+
+        async with self.session_factory() as session:
+            async with session.begin():
+                if conversation_id is None:
+                    conversation = Conversation(
+                        user_id=user_id,
+                        title=title,
+                        message_count=2 if greeting else 1,
+                        last_message_at=func.now()
+                    )
+                    session.add(conversation)
+                    await session.flush()
+                    conversation_id = conversation.id
+                    history = []
+
+                    if greeting:
+                        new_messages.append(self._add_message(session, conversation_id, "assistant", greeting))
+                else:
+                    # Bumping the counters doubles as the ownership check
+                    result = await session.execute(
+                        update(Conversation)
+                        .where(Conversation.id == conversation_id, Conversation.user_id == user_id)
+                        .values(
+                            message_count=Conversation.message_count + 1,
+                            last_message_at=func.now(),
+                            updated_at=func.now()
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                    if result.rowcount == 0:
+                        raise ConversationNotFoundError(conversation_id)
+
+                    cached = cache.get(conversation_id)
+                    if cached is not None:
+                        history, summary = cached
+                        cache_hit = True
+
+                new_messages.append(self._add_message(session, conversation_id, "user", content))
+
+                if history is None:
+                    await session.flush()
+                    history, summary = await self._load_tail(session, conversation_id)
+                    new_messages = []
+
+        # Only touch the cache once the transaction has committed
+        return self._remember_turn(conversation_id, history, summary, new_messages, cache_hit)
+
+    async def begin_turns(
+        self,
+        user_id: int,
+        prompts: list[tuple[Optional[int], str, Optional[str]]],
+        title: str = "Chat with Sparkie"
+    ) -> list[Optional[ChatTurn]]:
+        """
+        Open many independent turns in a single transaction.
+
+        Equivalent to calling begin_turn for every (conversation_id, content,
+        greeting) prompt, except that new conversations, messages and
+        counter updates are written together. Each conversation may appear
+        at most once.
+
+        Returns:
+            A ChatTurn per prompt, in order, or None where `conversation_id`
+            is not the user's
+        """
+        cache = self.history_cache
+        existing_ids = {conversation_id for conversation_id, _, _ in prompts if conversation_id is not None}
+        pending: list[Optional[tuple]] = [None] * len(prompts)
+        await self._wait_for_replies(existing_ids)
+
+        async with self.session_factory() as session:
+            async with session.begin():
+                owned: set[int] = set()
+                if existing_ids:
+                    result = await session.execute(
+                        select(Conversation.id)
+                        .where(Conversation.id.in_(existing_ids), Conversation.user_id == user_id)
+                    )
+                    owned = set(result.scalars())
+                    await bump_message_counters(session, {conversation_id: 1 for conversation_id in owned})
+
+                created = {}
+                for index, (conversation_id, _, greeting) in enumerate(prompts):
+                    if conversation_id is None:
+                        created[index] = Conversation(
+                            user_id=user_id,
+                            title=title,
+                            message_count=2 if greeting else 1,
+                            last_message_at=func.now()
+                        )
+                # New conversations need their ids back, so only these are flushed as objects
+                session.add_all(created.values())
+                await session.flush()
+
+                rows = []
+                for index, (conversation_id, content, greeting) in enumerate(prompts):
+                    history, summary, cache_hit = None, None, False
+                    new_messages: list[HistoryEntry] = []
+                    if conversation_id is None:
+                        conversation_id = created[index].id
+                        history = []
+                        if greeting:
+                            new_messages.append(("assistant", greeting, estimate_tokens(greeting)))
+                    elif conversation_id in owned:
+                        cached = cache.get(conversation_id)
+                        if cached is not None:
+                            history, summary = cached
+                            cache_hit = True
+                    else:
+                        continue
+                    new_messages.append(("user", content, estimate_tokens(content)))
+                    rows.extend(
+                        {"conversation_id": conversation_id, "role": role, "content": message, "token_count": token_count}
+                        for role, message, token_count in new_messages
+                    )
+                    pending[index] = (conversation_id, history, summary, new_messages, cache_hit)
+
+                if rows:
+                    await session.execute(insert(Message), rows)
+
+                # Cache misses read their tail, which now includes the new messages
+                for index, turn in enumerate(pending):
+                    if turn is not None and turn[1] is None:
+                        history, summary = await self._load_tail(session, turn[0])
+                        pending[index] = (turn[0], history, summary, [], False)
+
+        return [self._remember_turn(*turn) if turn is not None else None for turn in pending]
+
+    @staticmethod
+    async def _wait_for_replies(conversation_ids) -> None:
+        """
+        Wait for replies still queued in the message writer for these conversations.
+
+        The user message must get a later id than the reply to the previous
+        turn, and a history cache miss must find that reply in the database.
+        """
+        writer = get_message_writer()
+        if writer is not None and writer.running:
+            await writer.wait_written(conversation_ids)
+
+    def _remember_turn(
+        self,
+        conversation_id: int,
+        history: list[HistoryEntry],
+        summary: Optional[str],
+        new_messages: list[HistoryEntry],
+        cache_hit: bool
+    ) -> ChatTurn:
+        """Record a committed turn in the history cache and return it."""
+        cache = self.history_cache
+        if new_messages:
+            history = (history + new_messages)[-cache.window:]
+        if cache_hit:
+            for role, message, token_count in new_messages:
+                cache.append(conversation_id, role, message, token_count)
+        else:
+            cache.put(conversation_id, history, summary)
+
+        return ChatTurn(conversation_id=conversation_id, history=history, summary=summary)
+
+    @staticmethod
+    def _add_message(
+        session,
+        conversation_id: int,
+        role: str,
+        content: str,
+        truncated: bool = False
+    ) -> HistoryEntry:
+        """Add a message with its token count to the session and return its history entry."""
+        token_count = estimate_tokens(content)
+        session.add(Message(
+            conversation_id=conversation_id,
+            role=role,
+            content=content,
+            token_count=token_count,
+            truncated=truncated
+        ))
+        return role, content, token_count
+
+    async def _load_tail(self, session, conversation_id: int) -> tuple[list[HistoryEntry], Optional[str]]:
+        """Read the summary and only the most recent `window` messages after it."""
+        result = await session.execute(
+            select(Conversation.summary, Conversation.summary_message_id)
+            .where(Conversation.id == conversation_id)
+        )
+        summary, summary_message_id = result.one_or_none() or (None, None)
+
+        query = select(Message.role, Message.content, Message.token_count).where(
+            Message.conversation_id == conversation_id
+        )
+        if summary_message_id is not None:
+            query = query.where(Message.id > summary_message_id)
+
+        result = await session.execute(
+            query
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(self.history_cache.window)
+        )
+        return [tuple(row) for row in reversed(result.all())], summary
+
+    async def save_reply(self, conversation_id: int, content: str, truncated: bool = False) -> None:
+        """
+        Persist the assistant reply for a turn.
+
+        `truncated` marks a reply cut short because the client went away.
+
+        With the message writer running this only queues the row; the history
+        cache is updated immediately so the next turn sees the reply either way.
+        """
+        token_count = estimate_tokens(content)
+        writer = get_message_writer()
+
+        if writer is not None and writer.running:
+            await writer.enqueue(Message(
+                conversation_id=conversation_id,
+                role="assistant",
+                content=content,
+                token_count=token_count,
+                truncated=truncated
+            ))
+        else:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    self._add_message(session, conversation_id, "assistant", content, truncated)
+                    await bump_message_counters(session, {conversation_id: 1})
+
+        self.history_cache.append(conversation_id, "assistant", content, token_count)
+
+
+_chat_repository: Optional[ChatTurnRepository] = None
+
+
+def get_chat_repository() -> ChatTurnRepository:
+    """Get or create the chat turn repository singleton."""
+    global _chat_repository
+    if _chat_repository is None:
+        _chat_repository = ChatTurnRepository()
+    return _chat_repository
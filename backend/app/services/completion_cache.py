@@ -0,0 +1,189 @@
+"""
+Exact-match cache of MiniMax completions for deterministic requests.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is optional
+    aioredis = None
+
+
+class MemoryCacheBackend:
+    """In-process LRU store with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    async def close(self) -> None:
+        self._entries.clear()
+
+
+class RedisCacheBackend:
+    """Redis store shared between processes; eviction is left to Redis' maxmemory policy."""
+
+    PREFIX = "sparkie:completion:"
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("redis package is not installed")
+        self._client = aioredis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(self.PREFIX + key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self._client.set(self.PREFIX + key, value, ex=ttl)
+
+    def size(self) -> Optional[int]:
+        return None
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+class CompletionCache:
+    """
+    Caches full completions keyed by model, messages and sampling parameters.
+
+    Only requests with temperature 0 are cacheable; anything sampled is
+    expected to differ between calls. Backend errors are logged and treated
+    as misses so the cache can never fail a chat request.
+
+    The key covers every message the model sees, including the system
+    prompt (which names the user) and the conversation so far, so in
+    practice hits come from the same user asking the same thing again in
+    the same context; replies are never shared between users.
+    """
+
+    def __init__(self, backend, ttl: int = 3600):
+        self.backend = backend
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def is_cacheable(temperature: Optional[float]) -> bool:
+        return temperature is not None and temperature == 0
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: list[dict],
+        temperature: Optional[float],
+        max_tokens: Optional[int]
+    ) -> str:
+        """Hash of the request; only leading and trailing whitespace of each message is ignored."""
+        # Inner whitespace is kept: indentation and line breaks matter in code, tables and verse
+        normalized = [
+            {"role": msg["role"], "content": msg["content"].strip()}
+            for msg in messages
+        ]
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": normalized,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Completion cache read failed: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        if not value:
+            return
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Completion cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_completion_cache: Optional[CompletionCache] = None
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """Get the completion cache, or None when it is disabled."""
+    return _completion_cache
+
+
+async def init_completion_cache():
+    """Create the completion cache if enabled in settings."""
+    global _completion_cache
+    if not settings.completion_cache_enabled:
+        return
+
+    if settings.completion_cache_backend == "redis":
+        backend = RedisCacheBackend(settings.redis_url)
+    else:
+        backend = MemoryCacheBackend(max_entries=settings.completion_cache_max_entries)
+
+    _completion_cache = CompletionCache(backend, ttl=settings.completion_cache_ttl_seconds)
+    logger.info(f"Completion cache enabled ({type(backend).__name__})")
+
+
+async def close_completion_cache():
+    """Close the completion cache backend."""
+    global _completion_cache
+    if _completion_cache:
+        await _completion_cache.backend.close()
+        _completion_cache = None
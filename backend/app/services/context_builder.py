@@ -0,0 +1,128 @@
+"""
+Token-budget-aware context building for MiniMax chat requests.
+"""
+import re
+from typing import Optional, Sequence
+
+from app.config import settings
+
+
+# Runs of CJK characters tokenize roughly one token per character, other
+# words roughly one token per four characters, punctuation one token each.
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af"
+_TOKEN_PATTERN = re.compile(rf"[{_CJK}]|[^\W_{_CJK}]+|[^\w\s]|_+")
+
+# Per-message framing overhead of OpenAI-style chat formats (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate the number of tokens in a piece of text.
+
+    This is a local stand-in for the model's tokenizer: it never calls out
+    and errs slightly on the high side so the budget is not overrun.
+
+    Args:
+        text: Message content
+
+    Returns:
+        Estimated token count (at least 1 for non-empty text)
+    """
+    if not text:
+        return 0
+
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if len(piece) <= 4:
+            tokens += 1
+        else:
+            tokens += (len(piece) + 3) // 4
+    return max(tokens, 1)
+
+
+class ContextBuilder:
+    """
+    Builds the message list for a chat request within a token budget.
+
+    The budget covers the whole request: the system prompt, the rolling
+    conversation summary (if any), the volatile context and the reply
+    (`max_tokens`) are reserved first, then history is added newest first
+    until the remainder is used up. History entries carry precomputed
+    token counts, so nothing already stored is tokenized again.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 8192,
+        default_reply_tokens: int = 1024
+    ):
+        self.token_budget = token_budget
+        self.default_reply_tokens = default_reply_tokens
+
+    def build(
+        self,
+        system_prompt: str,
+        history: Sequence[tuple[str, str, Optional[int]]],
+        max_tokens: Optional[int] = None,
+        summary: Optional[str] = None,
+        system_tokens: Optional[int] = None,
+        context: Optional[str] = None
+    ) -> list[dict]:
+        """
+        Assemble API messages from the system prompt, summary and recent history.
+
+        Args:
+            system_prompt: Sparkie system prompt for this user
+            history: (role, content, token_count) tuples, oldest first
+            max_tokens: Requested reply length, reserved from the budget
+            summary: Rolling summary of messages older than `history`
+            system_tokens: Precomputed token count of `system_prompt`
+            context: Volatile context (such as the time), placed just before
+                the latest message so everything ahead of it stays stable
+
+        Returns:
+            Messages in OpenAI chat format. The latest message is always
+            included, even if it alone exceeds the budget.
+        """
+        reply_reserve = max_tokens or self.default_reply_tokens
+        if system_tokens is None:
+            system_tokens = estimate_tokens(system_prompt)
+        remaining = self.token_budget - system_tokens - MESSAGE_OVERHEAD_TOKENS - reply_reserve
+        if context:
+            remaining -= estimate_tokens(context) + MESSAGE_OVERHEAD_TOKENS
+
+        prefix = [{"role": "system", "content": system_prompt}]
+        if summary:
+            summary_message = f"Summary of the earlier conversation:\n{summary}"
+            prefix.append({"role": "system", "content": summary_message})
+            remaining -= estimate_tokens(summary_message) + MESSAGE_OVERHEAD_TOKENS
+
+        selected: list[dict] = []
+        for role, content, token_count in reversed(history):
+            if token_count is None:
+                token_count = estimate_tokens(content)
+            cost = token_count + MESSAGE_OVERHEAD_TOKENS
+            if cost > remaining and selected:
+                break
+            remaining -= cost
+            selected.append({"role": role, "content": content})
+
+        selected.reverse()
+        if context:
+            selected.insert(max(len(selected) - 1, 0), {"role": "system", "content": context})
+        return prefix + selected
+
+
+_context_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    """Get or create the context builder singleton."""
+    global _context_builder
+    if _context_builder is None:
+        _context_builder = ContextBuilder(
+            token_budget=settings.context_token_budget,
+            default_reply_tokens=settings.context_default_reply_tokens
+        )
+    return _context_builder
@@ -0,0 +1,164 @@
+"""
+In-memory cache of recent conversation history for context building.
+"""
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Iterable, Optional
+
+from app.config import settings
+
+
+# (role, content, token_count)
+HistoryEntry = tuple[str, str, Optional[int]]
+
+
+def _entry_size(entry: HistoryEntry) -> int:
+    role, content, _ = entry
+    return len(role) + len(content.encode("utf-8"))
+
+
+class _CachedHistory:
+    """Recent window and summary of one conversation, and their size in bytes."""
+
+    __slots__ = ("messages", "summary", "size")
+
+    def __init__(self, window: int, summary: Optional[str] = None):
+        self.messages: deque[HistoryEntry] = deque(maxlen=window)
+        self.summary = summary
+        self.size = len(summary.encode("utf-8")) if summary else 0
+
+    def append(self, entry: HistoryEntry) -> int:
+        """Append an entry and return the change in size."""
+        before = self.size
+        if len(self.messages) == self.messages.maxlen:
+            self.size -= _entry_size(self.messages[0])
+        self.messages.append(entry)
+        self.size += _entry_size(entry)
+        return self.size - before
+
+
+class ConversationHistoryCache:
+    """
+    Per-process LRU cache of the last `window` messages of each conversation.
+
+    Entries are (role, content, token_count) tuples covering only messages
+    after the conversation's rolling summary, which is cached alongside
+    them. Conversations are evicted least recently used first once either
+    `max_conversations` or `max_bytes` is exceeded. The cache is only
+    correct while a single process writes a conversation, which is how the
+    app is deployed (one uvicorn worker).
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        max_conversations: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024
+    ):
+        self.window = window
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[int, _CachedHistory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, conversation_id: int) -> Optional[tuple[list[HistoryEntry], Optional[str]]]:
+        """Return the cached (window, summary) for a conversation, or None on a miss."""
+        with self._lock:
+            cached = self._entries.get(conversation_id)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return list(cached.messages), cached.summary
+
+    def put(
+        self,
+        conversation_id: int,
+        messages: Iterable[HistoryEntry],
+        summary: Optional[str] = None
+    ) -> None:
+        """Replace the cached window and summary for a conversation."""
+        cached = _CachedHistory(self.window, summary)
+        for role, content, token_count in messages:
+            cached.append((role, content, token_count))
+
+        with self._lock:
+            previous = self._entries.pop(conversation_id, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[conversation_id] = cached
+            self._bytes += cached.size
+            self._evict()
+
+    def append(
+        self,
+        conversation_id: int,
+        role: str,
+        content: str,
+        token_count: Optional[int] = None
+    ) -> bool:
+        """
+        Append a message to a cached conversation in place.
+
+        Returns:
+            True if the conversation was cached, False otherwise
+        """
+        with self._lock:
+            cached = self._entries.get(conversation_id)
+            if cached is None:
+                return False
+            self._bytes += cached.append((role, content, token_count))
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+            return True
+
+    def invalidate(self, conversation_id: int) -> None:
+        """Drop a conversation from the cache."""
+        with self._lock:
+            cached = self._entries.pop(conversation_id, None)
+            if cached is not None:
+                self._bytes -= cached.size
+
+    def _evict(self) -> None:
+        # Never evict the most recently used entry, even if it alone exceeds max_bytes
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_conversations or self._bytes > self.max_bytes
+        ):
+            _, cached = self._entries.popitem(last=False)
+            self._bytes -= cached.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "conversations": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_history_cache: Optional[ConversationHistoryCache] = None
+
+
+def get_history_cache() -> ConversationHistoryCache:
+    """Get or create the history cache singleton."""
+    global _history_cache
+    if _history_cache is None:
+        _history_cache = ConversationHistoryCache(
+            window=settings.history_cache_window,
+            max_conversations=settings.history_cache_max_conversations,
+            max_bytes=settings.history_cache_max_bytes
+        )
+    return _history_cache
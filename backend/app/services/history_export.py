@@ -0,0 +1,194 @@
+"""
+Streaming export of a user's full chat history as gzip-compressed NDJSON.
+
+Run as a CLI (from backend/):
+    python -m app.services.history_export --username bee --output bee.ndjson.gz
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import and_, or_, select
+from loguru import logger
+
+from app.config import settings
+from app.models.database import async_session, init_db, close_db, Conversation, Message, User
+from app.services.pagination import keyset_after, sort_key
+
+
+def _encode_rows(kind: str, rows) -> bytes:
+    """One NDJSON line per row, tagged with its record type."""
+    lines = []
+    for row in rows:
+        record = {"type": kind}
+        for key, value in row._mapping.items():
+            if key == "sort_key":
+                continue
+            record[key] = value.isoformat() if isinstance(value, datetime) else value
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class HistoryExport:
+    """
+    One user's account, conversations and messages as a gzip NDJSON stream.
+
+    Rows are read `batch_size` at a time, each batch by its own keyset
+    query in a fresh session, so no read transaction (and, on SQLite, no
+    lock that would block writers) stays open while a slow client
+    downloads. Each batch is serialized and fed to a single gzip stream in
+    a worker thread, so memory stays flat however large the history is and
+    the event loop is not blocked by compression.
+    """
+
+    def __init__(
+        self,
+        user_id: int,
+        session_factory=async_session,
+        batch_size: int = 1000,
+        compress_level: int = 6
+    ):
+        self.user_id = user_id
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.compress_level = compress_level
+
+        self.rows = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.elapsed = 0.0
+
+    def _queries(self):
+        """(record type, query, condition for the rows after a given row or None if unpaged)."""
+        yield "user", select(
+            User.id, User.username, User.email, User.created_at
+        ).where(User.id == self.user_id), None
+        yield "conversation", select(
+            Conversation.id,
+            Conversation.title,
+            Conversation.summary,
+            Conversation.message_count,
+            Conversation.created_at,
+            Conversation.updated_at
+        ).where(Conversation.user_id == self.user_id).order_by(Conversation.id), (
+            lambda row: Conversation.id > row.id
+        )
+        # Ordered along ix_messages_conversation_created so the database needs no sort
+        yield "message", select(
+            Message.id,
+            Message.conversation_id,
+            Message.role,
+            Message.content,
+            Message.truncated,
+            Message.created_at,
+            sort_key(Message.created_at).label("sort_key")
+        ).join(Conversation, Message.conversation_id == Conversation.id).where(
+            Conversation.user_id == self.user_id
+        ).order_by(Message.conversation_id, sort_key(Message.created_at), Message.id), (
+            lambda row: or_(
+                Message.conversation_id > row.conversation_id,
+                and_(
+                    Message.conversation_id == row.conversation_id,
+                    keyset_after(Message.created_at, Message.id, row.sort_key, row.id)
+                )
+            )
+        )
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yield the gzip stream chunk by chunk."""
+        # wbits=31: zlib deflate with a gzip header and trailer
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, 31)
+
+        def compress(kind: str, rows) -> bytes:
+            data = _encode_rows(kind, rows)
+            self.raw_bytes += len(data)
+            return compressor.compress(data)
+
+        started = time.perf_counter()
+        for kind, query, after in self._queries():
+            page = query if after is None else query.limit(self.batch_size)
+            while True:
+                async with self.session_factory() as session:
+                    rows = (await session.execute(page)).all()
+                if rows:
+                    chunk = await asyncio.to_thread(compress, kind, rows)
+                    self.rows += len(rows)
+                    if chunk:
+                        self.compressed_bytes += len(chunk)
+                        yield chunk
+                if after is None or len(rows) < self.batch_size:
+                    break
+                page = query.where(after(rows[-1])).limit(self.batch_size)
+
+        tail = compressor.flush()
+        self.compressed_bytes += len(tail)
+        yield tail
+
+        self.elapsed = time.perf_counter() - started
+        self._log_throughput()
+
+    def _log_throughput(self) -> None:
+        elapsed = max(self.elapsed, 1e-9)
+        message = (
+            f"History export for user {self.user_id}: {self.rows} rows, "
+            f"{self.raw_bytes / 1e6:.1f} MB -> {self.compressed_bytes / 1e6:.1f} MB gzip "
+            f"in {self.elapsed:.2f}s ({self.rows / elapsed:.0f} rows/s, "
+            f"{self.raw_bytes / 1e6 / elapsed:.1f} MB/s)"
+        )
+        if self.rows >= settings.export_log_min_rows:
+            logger.info(message)
+        else:
+            logger.debug(message)
+
+
+async def _find_user_id(username: str) -> Optional[int]:
+    async with async_session() as session:
+        result = await session.execute(select(User.id).where(User.username == username))
+        return result.scalar_one_or_none()
+
+
+async def _main(args) -> int:
+    await init_db()
+    try:
+        user_id = args.user_id if args.user_id is not None else await _find_user_id(args.username)
+        if user_id is None:
+            print(f"User not found: {args.username}", file=sys.stderr)
+            return 1
+
+        export = HistoryExport(user_id, batch_size=args.batch_size, compress_level=args.level)
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            async for chunk in export.stream():
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+
+        print(
+            f"Exported {export.rows} rows ({export.compressed_bytes / 1e6:.1f} MB) "
+            f"in {export.elapsed:.2f}s",
+            file=sys.stderr
+        )
+        return 0
+    finally:
+        await close_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Export a user's chat history as gzip-compressed NDJSON.")
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument("--username")
+    who.add_argument("--user-id", type=int)
+    parser.add_argument("--output", "-o", required=True, help="Output file, or - for stdout")
+    parser.add_argument("--batch-size", type=int, default=settings.export_batch_size)
+    parser.add_argument("--level", type=int, default=6, choices=range(1, 10), metavar="1-9", help="gzip level")
+    return asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
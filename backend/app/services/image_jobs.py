@@ -0,0 +1,304 @@
+"""
+Background image generation jobs: a bounded worker pool with per-user limits.
+"""
+import asyncio
+import math
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.image_store import StoredImage, get_image_store
+from app.services.image_variants import get_variant_renderer
+from app.services.modelscope_image import ModelScopeImageService, get_modelscope_service
+
+
+class ImageGenerationFailed(Exception):
+    """ModelScope did not produce an image; `result` is the service's error dict."""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get("message", "Image generation failed"))
+        self.result = result
+
+
+async def generate_stored_image(
+    service: ModelScopeImageService,
+    prompt: str,
+    size: str,
+    steps: int,
+    user_id: Optional[int] = None
+) -> tuple[StoredImage, dict, bool]:
+    """
+    The stored image for a generation request, generating it on a store miss.
+    
+    Generations are queued for `user_id` under the ModelScope quota.
+
+    Returns:
+        (image, metadata, cached)
+
+    Raises:
+        ImageGenerationFailed: If ModelScope failed or the image could not be downloaded
+    """
+    store = get_image_store()
+    metadata = service.describe(prompt, size, steps)
+    key = store.key(metadata["enhanced_prompt"], metadata["size"], metadata["steps"], metadata["model"])
+    image = await store.get(key)
+    if image is not None:
+        get_variant_renderer().schedule(image)
+        return image, metadata, True
+
+    result = await service.generate_image(prompt=prompt, size=size, steps=steps, user_id=user_id)
+    if not result["success"]:
+        raise ImageGenerationFailed(result)
+    data = await service.download_image(result)
+    if data is None:
+        raise ImageGenerationFailed({
+            "success": False,
+            "error": "Download failed",
+            "message": "The generated image could not be downloaded. Please try again."
+        })
+    image = await store.put(key, data)
+    get_variant_renderer().schedule(image)
+    return image, metadata, False
+
+
+class ImageJobRejected(Exception):
+    """A job was not accepted: the user has too many running, or the queue is full."""
+
+    def __init__(self, reason: str, user_limit: bool, retry_after: int = 1):
+        super().__init__(reason)
+        self.user_limit = user_limit
+        self.retry_after = retry_after
+
+
+class ImageJob:
+    """One queued image generation and its outcome."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self, user_id: int, prompt: str, size: str, steps: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.prompt = prompt
+        self.size = size
+        self.steps = steps
+
+        self.status = self.QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.image: Optional[StoredImage] = None
+        self.metadata: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.message: Optional[str] = None
+
+        # Bumped on every status change; waiters block on `_changed`
+        self.version = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def _update(self, status: str) -> None:
+        self.status = status
+        self.version += 1
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        """Wait until the job moves past `version`; False if `timeout` passed first."""
+        changed = self._changed
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class ImageJobQueue:
+    """
+    Runs image generations on `workers` background tasks.
+
+    Submitting returns at once with a job the client can poll or follow
+    over SSE, so no HTTP request is held open while ModelScope works. A
+    user may have at most `max_per_user` jobs queued or running, and at
+    most `max_queued` jobs wait overall. Finished jobs are kept for
+    `result_ttl` seconds, then forgotten (the image itself stays in the
+    image store until evicted).
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_per_user: int = 2,
+        max_queued: int = 100,
+        result_ttl: float = 3600.0
+    ):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+
+        self._queue: asyncio.Queue[ImageJob] = asyncio.Queue()
+        self._jobs: dict[str, ImageJob] = {}
+        self._active: dict[int, int] = defaultdict(int)
+        self._tasks: list[asyncio.Task] = []
+        # Moving average of generation time, for Retry-After estimates
+        self._avg_duration = 10.0
+
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        if not self.running:
+            self._tasks = [
+                asyncio.create_task(self._work(), name=f"image-job-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    async def stop(self) -> None:
+        """Stop the workers; running and still queued jobs fail so their followers are not left waiting."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._cancel(job)
+            self._finish(job)
+
+    def submit(self, user_id: int, prompt: str, size: str, steps: int) -> ImageJob:
+        """
+        Queue a generation for a user.
+
+        Raises:
+            ImageJobRejected: If the user is at their limit or the queue is full
+        """
+        if self._active[user_id] >= self.max_per_user:
+            self.rejected += 1
+            raise ImageJobRejected(
+                f"You already have {self._active[user_id]} images being generated; "
+                "wait for one to finish",
+                user_limit=True
+            )
+        if self._queue.qsize() >= self.max_queued:
+            self.rejected += 1
+            raise ImageJobRejected("Image generation queue is full", user_limit=False, retry_after=self.retry_after())
+
+        job = ImageJob(user_id, prompt, size, steps)
+        self._jobs[job.id] = job
+        self._active[user_id] += 1
+        self._queue.put_nowait(job)
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str, user_id: int) -> Optional[ImageJob]:
+        """A job by id, only if it belongs to `user_id`."""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.started_at = time.time()
+            job._update(ImageJob.RUNNING)
+            try:
+                job.image, job.metadata, _ = await generate_stored_image(
+                    get_modelscope_service(), job.prompt, job.size, job.steps, job.user_id
+                )
+                self.succeeded += 1
+                job._update(ImageJob.SUCCEEDED)
+            except asyncio.CancelledError:
+                self._cancel(job)
+                raise
+            except Exception as e:
+                result = e.result if isinstance(e, ImageGenerationFailed) else {}
+                if not result:
+                    logger.exception(f"Image job {job.id} failed: {e}")
+                job.error = result.get("error", "Generation failed")
+                job.message = result.get("message", "Image generation failed. Please try again.")
+                self.failed += 1
+                job._update(ImageJob.FAILED)
+            finally:
+                self._finish(job)
+
+    def _cancel(self, job: ImageJob) -> None:
+        job.error, job.message = "Cancelled", "The server is shutting down. Please try again."
+        self.failed += 1
+        job._update(ImageJob.FAILED)
+
+    def _finish(self, job: ImageJob) -> None:
+        job.finished_at = time.time()
+        if job.started_at is not None:
+            self._avg_duration += 0.1 * (job.finished_at - job.started_at - self._avg_duration)
+        self._active[job.user_id] -= 1
+        if not self._active[job.user_id]:
+            del self._active[job.user_id]
+        asyncio.get_running_loop().call_later(self.result_ttl, self._jobs.pop, job.id, None)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is expected to drain, clamped to 1-300."""
+        backlog = (self._queue.qsize() + 1) / self.workers
+        return min(max(math.ceil(backlog * self._avg_duration), 1), 300)
+
+    def stats(self) -> dict:
+        running = sum(1 for job in self._jobs.values() if job.status == ImageJob.RUNNING)
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": running,
+            "retained": len(self._jobs),
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_duration_ms": round(self._avg_duration * 1000, 1),
+        }
+
+
+_image_job_queue: Optional[ImageJobQueue] = None
+
+
+def get_image_job_queue() -> ImageJobQueue:
+    """Get or create the image job queue singleton (workers are started by `init_image_job_queue`)."""
+    global _image_job_queue
+    if _image_job_queue is None:
+        _image_job_queue = ImageJobQueue(
+            workers=settings.image_job_workers,
+            max_per_user=settings.image_job_max_per_user,
+            max_queued=settings.image_job_max_queued,
+            result_ttl=settings.image_job_result_ttl_seconds
+        )
+    return _image_job_queue
+
+
+async def init_image_job_queue():
+    """Create the image job queue and start its workers."""
+    global _image_job_queue
+    if _image_job_queue is None:
+        get_image_job_queue().start()
+
+
+async def close_image_job_queue():
+    """Stop the image job workers."""
+    global _image_job_queue
+    if _image_job_queue:
+        await _image_job_queue.stop()
+        _image_job_queue = None
@@ -0,0 +1,262 @@
+"""
+Content-addressed on-disk store for generated images.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+# Blob file names: sha256 of the image bytes plus an extension
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}\.(png|jpg|webp|gif)$")
+# Derived variants, stored next to their blob: <sha256>-<variant>.webp
+VARIANT_NAME = re.compile(r"^([0-9a-f]{64})-([a-z]+)\.webp$")
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "gif": "image/gif",
+}
+
+
+def sniff_extension(data: bytes) -> str:
+    """File extension for image bytes, from their magic number (PNG if unknown)."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return "png"
+
+
+class StoredImage(NamedTuple):
+    """A blob in the store; `digest` doubles as its ETag."""
+    name: str
+    digest: str
+    size: int
+    path: Path
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.name.rsplit(".", 1)[1]]
+
+
+class ImageStore:
+    """
+    Generated images on disk, addressed by the hash of their bytes.
+
+    Blobs live in `<root>/blobs/<sha256>.<ext>`, so identical images are
+    stored once and a blob never changes after it is written. Generation
+    requests map onto blobs through `<root>/keys/<request key>`, a file
+    holding the blob name, where the request key hashes everything that
+    determines the image (enhanced prompt, size, steps, model).
+
+    Derived variants (WebP, thumbnail) sit next to their blob as
+    `<sha256>-<variant>.webp`, count towards its size and go with it.
+
+    Blobs are evicted least recently used first once they total more than
+    `max_bytes`; recency survives restarts through file modification times.
+    Keys whose blob has been evicted simply miss.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._blobs_dir = self.root / "blobs"
+        self._keys_dir = self.root / "keys"
+        # blob name -> size including variants, least recently used first
+        self._blobs: OrderedDict[str, int] = OrderedDict()
+        # blob name -> {variant: size}
+        self._variants: dict[str, dict[str, int]] = {}
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(prompt: str, size: str, steps: int, model: str) -> str:
+        """Request key for one generation's parameters."""
+        canonical = json.dumps([prompt, size, steps, model], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def load(self) -> None:
+        """Index the blobs already on disk (blocking; run once at startup)."""
+        self._blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._keys_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        variants = []
+        for entry in os.scandir(self._blobs_dir):
+            if BLOB_NAME.match(entry.name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+            elif VARIANT_NAME.match(entry.name):
+                variants.append(entry)
+        for _, name, size in sorted(found):
+            self._blobs[name] = size
+            self.total_bytes += size
+        digests = {name.split(".", 1)[0]: name for name in self._blobs}
+        for entry in variants:
+            digest, variant = VARIANT_NAME.match(entry.name).groups()
+            if digest in digests:
+                self._add_variant(digests[digest], variant, entry.stat().st_size)
+            else:
+                os.unlink(entry.path)
+        self._evict()
+        # Drop keys whose blob was evicted, so they do not pile up across restarts
+        for entry in os.scandir(self._keys_dir):
+            try:
+                with open(entry.path) as f:
+                    if f.read() in self._blobs:
+                        continue
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def _stored(self, name: str) -> StoredImage:
+        size = self._blobs[name] - sum(self._variants.get(name, {}).values())
+        return StoredImage(name, name.split(".", 1)[0], size, self._blobs_dir / name)
+
+    def _touch(self, name: str) -> None:
+        self._blobs.move_to_end(name)
+        try:
+            os.utime(self._blobs_dir / name)
+        except OSError:
+            pass
+
+    def _variant_name(self, name: str, variant: str) -> str:
+        return f"{name.split('.', 1)[0]}-{variant}.webp"
+
+    def _add_variant(self, name: str, variant: str, size: int) -> None:
+        previous = self._variants.setdefault(name, {}).get(variant, 0)
+        self._variants[name][variant] = size
+        self._blobs[name] += size - previous
+        self.total_bytes += size - previous
+
+    def has_variants(self, name: str, variants) -> bool:
+        """Whether all of `variants` exist for a blob."""
+        return all(v in self._variants.get(name, {}) for v in variants)
+
+    def variant(self, name: str, variant: str) -> Optional[StoredImage]:
+        """A derived variant of a blob, if it has been rendered."""
+        size = self._variants.get(name, {}).get(variant)
+        if size is None:
+            return None
+        self._touch(name)
+        digest = name.split(".", 1)[0]
+        file_name = self._variant_name(name, variant)
+        return StoredImage(file_name, f"{digest}-{variant}", size, self._blobs_dir / file_name)
+
+    async def put_variants(self, name: str, variants: dict[str, bytes]) -> None:
+        """Store rendered variants next to their blob (ignored if it was evicted meanwhile)."""
+        for variant, data in variants.items():
+            if name not in self._blobs:
+                return
+            await asyncio.to_thread(self._write_atomic, self._blobs_dir / self._variant_name(name, variant), data)
+            if name not in self._blobs:
+                # Evicted while writing
+                os.unlink(self._blobs_dir / self._variant_name(name, variant))
+                return
+            self._add_variant(name, variant, len(data))
+        self._evict()
+
+    def blob(self, name: str) -> Optional[StoredImage]:
+        """A stored blob by file name, for serving."""
+        if name not in self._blobs:
+            return None
+        self._touch(name)
+        return self._stored(name)
+
+    async def get(self, key: str) -> Optional[StoredImage]:
+        """The image stored for a request key, if it is still on disk."""
+        try:
+            name = await asyncio.to_thread((self._keys_dir / key).read_text)
+        except (FileNotFoundError, OSError):
+            name = None
+        if name is None or name not in self._blobs:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(name)
+        return self._stored(name)
+
+    async def put(self, key: str, data: bytes) -> StoredImage:
+        """Store image bytes under their hash and point `key` at them."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{sniff_extension(data)}"
+        if name not in self._blobs:
+            await asyncio.to_thread(self._write_atomic, self._blobs_dir / name, data)
+            self._blobs[name] = len(data)
+            self.total_bytes += len(data)
+        self._touch(name)
+        await asyncio.to_thread(self._write_atomic, self._keys_dir / key, name.encode())
+        stored = self._stored(name)
+        self._evict()
+        return stored
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _evict(self) -> None:
+        # The newest blob always stays, even if it alone exceeds the limit
+        while self.total_bytes > self.max_bytes and len(self._blobs) > 1:
+            name, size = self._blobs.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            files = [name] + [self._variant_name(name, v) for v in self._variants.pop(name, {})]
+            for file_name in files:
+                try:
+                    os.unlink(self._blobs_dir / file_name)
+                except FileNotFoundError:
+                    pass
+            logger.debug(f"Evicted image {name} ({size} bytes)")
+
+    def stats(self) -> dict:
+        return {
+            "images": len(self._blobs),
+            "variants": sum(len(v) for v in self._variants.values()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_image_store: Optional[ImageStore] = None
+
+
+def get_image_store() -> ImageStore:
+    """Get or create the image store singleton."""
+    global _image_store
+    if _image_store is None:
+        _image_store = ImageStore(settings.image_store_dir, settings.image_store_max_mb * 1024 * 1024)
+        _image_store.load()
+    return _image_store
+
+
+async def init_image_store():
+    """Open the image store and index the images already on disk."""
+    global _image_store
+    store = ImageStore(settings.image_store_dir, settings.image_store_max_mb * 1024 * 1024)
+    await asyncio.to_thread(store.load)
+    _image_store = store
+    logger.info(f"Image store ready: {store.stats()['images']} images ({store.total_bytes / 1e6:.1f} MB) in {store.root}")
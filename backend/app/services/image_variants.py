@@ -0,0 +1,190 @@
+"""
+WebP and thumbnail variants of stored images, rendered in a process pool.
+"""
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.image_store import ImageStore, StoredImage, get_image_store
+from app.services.modelscope_image import SingleFlight
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+
+VARIANTS = ("webp", "thumb")
+
+MEDIA_TYPE = "image/webp"
+
+
+def render_variants(data: bytes, thumbnail_size: int, quality: int) -> dict[str, bytes]:
+    """
+    Full-size WebP and a WebP thumbnail of an image.
+
+    Runs in a worker process: decoding and encoding a 1024px image takes
+    tens of milliseconds of CPU that must not run on the event loop.
+    """
+    def encode(img) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, "WEBP", quality=quality, method=4)
+        return buffer.getvalue()
+
+    with Image.open(io.BytesIO(data)) as img:
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if img.mode in ("LA", "P", "PA") else "RGB")
+        thumbnail = img.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
+        return {"webp": encode(img), "thumb": encode(thumbnail)}
+
+
+class VariantRenderer:
+    """
+    Renders the WebP and thumbnail variants of stored images.
+
+    Rendering happens on a pool of `workers` processes (spawned, not
+    forked, so they never inherit the event loop's threads or locks). New
+    images are rendered in the background as soon as they are stored; a
+    variant requested before that is rendered on demand, and concurrent
+    requests for the same image share one render. If a worker dies and
+    breaks the pool, the pool is swapped for a fresh one and the render is
+    retried once. Without Pillow installed the renderer is unavailable and
+    only originals are served.
+    """
+
+    def __init__(self, store: ImageStore, workers: int = 2, thumbnail_size: int = 256, quality: int = 82):
+        self.store = store
+        self.workers = workers
+        self.thumbnail_size = thumbnail_size
+        self.quality = quality
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = asyncio.Lock()
+        self._renders = SingleFlight()
+        self._background: set[asyncio.Task] = set()
+
+        self.rendered = 0
+        self.failures = 0
+        self.render_ms = 0.0
+
+    @property
+    def available(self) -> bool:
+        return Image is not None and self._pool is not None
+
+    def start(self) -> None:
+        if Image is None:
+            logger.warning("Pillow is not installed; WebP and thumbnail image variants are disabled")
+            return
+        if self._pool is None:
+            self._pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self) -> None:
+        for task in self._background:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def ensure(self, image: StoredImage) -> bool:
+        """Render the variants of an image unless they exist; False if that failed."""
+        if not self.available:
+            return False
+        if self.store.has_variants(image.name, VARIANTS):
+            return True
+        return await self._renders.do(image.name, lambda: self._render(image))
+
+    def schedule(self, image: StoredImage) -> None:
+        """Render the variants of an image in the background unless they exist."""
+        if not self.available or self.store.has_variants(image.name, VARIANTS):
+            return
+        task = asyncio.create_task(self.ensure(image))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _replace_pool(self, broken: ProcessPoolExecutor) -> bool:
+        """Swap a broken pool for a fresh one; False if the renderer was stopped meanwhile."""
+        async with self._pool_lock:
+            if self._pool is None:
+                return False
+            # Renders that failed on the same pool replace it only once
+            if self._pool is broken:
+                logger.warning("Image variant worker pool broke; starting a new one")
+                self._pool = self._new_pool()
+                broken.shutdown(wait=False)
+            return True
+
+    async def _render(self, image: StoredImage) -> bool:
+        started = time.perf_counter()
+        try:
+            data = await asyncio.to_thread(image.path.read_bytes)
+            for attempt in range(2):
+                pool = self._pool
+                try:
+                    variants = await asyncio.get_running_loop().run_in_executor(
+                        pool, render_variants, data, self.thumbnail_size, self.quality
+                    )
+                    break
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); retry once on a fresh pool
+                    if attempt or pool is None or not await self._replace_pool(pool):
+                        raise
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Rendering variants of {image.name} failed: {e!r}")
+            return False
+        await self.store.put_variants(image.name, variants)
+        self.rendered += 1
+        self.render_ms += (time.perf_counter() - started) * 1000
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "workers": self.workers if self.available else 0,
+            "rendered": self.rendered,
+            "failures": self.failures,
+            "avg_render_ms": round(self.render_ms / self.rendered, 1) if self.rendered else 0.0,
+            "in_flight": self._renders.stats()["in_flight"],
+        }
+
+
+_variant_renderer: Optional[VariantRenderer] = None
+
+
+def get_variant_renderer() -> VariantRenderer:
+    """Get or create the image variant renderer singleton (its pool is started by `init_variant_renderer`)."""
+    global _variant_renderer
+    if _variant_renderer is None:
+        _variant_renderer = VariantRenderer(
+            get_image_store(),
+            workers=settings.image_variant_workers,
+            thumbnail_size=settings.image_thumbnail_size,
+            quality=settings.image_webp_quality
+        )
+    return _variant_renderer
+
+
+async def init_variant_renderer():
+    """Create the variant renderer and start its worker processes."""
+    global _variant_renderer
+    if _variant_renderer is None:
+        get_variant_renderer().start()
+
+
+async def close_variant_renderer():
+    """Shut down the variant worker processes."""
+    global _variant_renderer
+    if _variant_renderer:
+        _variant_renderer.stop()
+        _variant_renderer = None
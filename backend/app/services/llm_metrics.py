@@ -0,0 +1,123 @@
+"""
+Prometheus metrics for upstream LLM calls.
+"""
+import time
+from typing import Any, Optional
+
+from prometheus_client import Counter, Histogram
+
+from app.services.context_builder import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+
+LLM_REQUESTS = Counter(
+    "sparkie_llm_requests_total",
+    "Upstream chat completion requests",
+    ["model", "stream"]
+)
+LLM_ERRORS = Counter(
+    "sparkie_llm_errors_total",
+    "Failed upstream chat completion requests by exception type",
+    ["model", "error"]
+)
+LLM_PROMPT_TOKENS = Counter(
+    "sparkie_llm_prompt_tokens_total",
+    "Prompt tokens sent upstream",
+    ["model"]
+)
+LLM_COMPLETION_TOKENS = Counter(
+    "sparkie_llm_completion_tokens_total",
+    "Completion tokens received from upstream",
+    ["model"]
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "sparkie_llm_time_to_first_token_seconds",
+    "Time from sending a streaming request to its first content delta",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0)
+)
+LLM_INTER_TOKEN = Histogram(
+    "sparkie_llm_inter_token_seconds",
+    "Gap between consecutive content deltas of a stream",
+    ["model"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+LLM_DURATION = Histogram(
+    "sparkie_llm_request_duration_seconds",
+    "Total upstream time of a chat completion request",
+    ["model", "stream"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+)
+
+
+def usage_dict(usage: Any) -> Optional[dict]:
+    """Token usage from an API response (model object or plain dict) as a dict."""
+    if usage is None:
+        return None
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+    prompt = usage.get("prompt_tokens") or 0
+    completion = usage.get("completion_tokens") or 0
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": usage.get("total_tokens") or prompt + completion,
+    }
+
+
+class CallMetrics:
+    """
+    Timing and token accounting for one upstream call.
+
+    Call `on_delta` for every content delta of a stream and `finish` once
+    the call has ended; `fail` records an error instead. `finish` only
+    counts once, so it can also run on the way out of a stream that its
+    consumer closed early. When the upstream reports no `usage`, token
+    counts are estimated locally.
+    """
+
+    def __init__(self, model: str, messages: list[dict], stream: bool):
+        self.model = model
+        self.messages = messages
+        self.stream = "true" if stream else "false"
+        self.started = time.perf_counter()
+        self.usage: Any = None
+        self._last_delta: Optional[float] = None
+        self._text_parts: list[str] = []
+        self._result: Optional[dict] = None
+        self._failed = False
+        LLM_REQUESTS.labels(model, self.stream).inc()
+
+    def on_delta(self, text: str) -> None:
+        now = time.perf_counter()
+        if self._last_delta is None:
+            LLM_TIME_TO_FIRST_TOKEN.labels(self.model).observe(now - self.started)
+        else:
+            LLM_INTER_TOKEN.labels(self.model).observe(now - self._last_delta)
+        self._last_delta = now
+        self._text_parts.append(text)
+
+    def finish(self, text: Optional[str] = None) -> Optional[dict]:
+        """Record duration and tokens; returns the usage dict (None after `fail`)."""
+        if self._result is not None or self._failed:
+            return self._result
+        LLM_DURATION.labels(self.model, self.stream).observe(time.perf_counter() - self.started)
+        result = usage_dict(self.usage)
+        if result is None:
+            completion_text = text if text is not None else "".join(self._text_parts)
+            prompt = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in self.messages)
+            completion = estimate_tokens(completion_text)
+            result = {
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "total_tokens": prompt + completion,
+                "estimated": True,
+            }
+        LLM_PROMPT_TOKENS.labels(self.model).inc(result["prompt_tokens"])
+        LLM_COMPLETION_TOKENS.labels(self.model).inc(result["completion_tokens"])
+        self._result = result
+        return result
+
+    def fail(self, error: BaseException) -> None:
+        self._failed = True
+        LLM_DURATION.labels(self.model, self.stream).observe(time.perf_counter() - self.started)
+        LLM_ERRORS.labels(self.model, type(error).__name__).inc()
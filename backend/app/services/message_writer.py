@@ -0,0 +1,291 @@
+"""
+Write-behind persistence for chat messages.
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.exc import DataError, IntegrityError, ProgrammingError
+from loguru import logger
+
+from app.config import settings
+from app.models.database import async_session, Conversation, Message
+from app.services.history_cache import get_history_cache
+
+
+_STOP = object()
+
+# Errors that retrying the same row cannot fix
+_PERMANENT_ERRORS = (IntegrityError, DataError, ProgrammingError)
+
+
+async def bump_message_counters(session, counts: dict[int, int]) -> None:
+    """Add newly inserted messages to each conversation's message_count / last_message_at."""
+    if not counts:
+        return
+    table = Conversation.__table__
+    await session.execute(
+        update(table)
+        .where(table.c.id == bindparam("cid"))
+        .values(
+            message_count=table.c.message_count + bindparam("added"),
+            last_message_at=func.now(),
+            updated_at=func.now()
+        ),
+        [{"cid": conversation_id, "added": added} for conversation_id, added in counts.items()]
+    )
+
+
+class MessageWriter:
+    """
+    Batches Message inserts off the request path.
+
+    Messages are put on a bounded queue and written by a single background
+    task in multi-row INSERTs, flushed when `batch_size` rows are waiting or
+    `flush_interval` seconds after the first row of a batch arrived. When the
+    queue is full, `enqueue` waits, which pushes back on producers instead of
+    growing memory without bound.
+
+    Rows still queued for a conversation are tracked, so the next turn can
+    `wait_written` for them before inserting its user message and ids stay in
+    conversation order. A batch that fails is retried row by row, and a row
+    that hits a transient error (a locked database, a dropped connection) is
+    retried up to `max_retries` times with exponential backoff. A row that
+    is rejected outright (e.g. an IntegrityError) or runs out of retries
+    drops its conversation from the history cache, so the model context
+    goes back to what the database holds.
+    """
+
+    def __init__(
+        self,
+        session_factory=async_session,
+        max_queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_retries: int = 3,
+        retry_backoff: float = 0.1
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        # conversation id -> rows queued or being written, and events set once none are
+        self._pending: Counter = Counter()
+        self._written: dict[int, asyncio.Event] = {}
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start the background flush task."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="message-writer")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything still queued and stop the background task."""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Message writer did not drain within {timeout}s, {self._queue.qsize()} messages lost")
+            self._task.cancel()
+        self._task = None
+        # Nothing more will be written; release anyone still waiting
+        self._done(list(self._pending.elements()))
+
+    async def enqueue(self, message: Message) -> None:
+        """Queue a message for writing, waiting if the queue is full."""
+        self._pending[message.conversation_id] += 1
+        await self._queue.put(message)
+
+    async def wait_written(self, conversation_ids: Iterable[int]) -> None:
+        """Wait until every message queued so far for these conversations has been written (or dropped)."""
+        for conversation_id in conversation_ids:
+            if self._pending[conversation_id] > 0:
+                await self._written.setdefault(conversation_id, asyncio.Event()).wait()
+
+    def _done(self, conversation_ids: list[int]) -> None:
+        for conversation_id, count in Counter(conversation_ids).items():
+            self._pending[conversation_id] -= count
+            if self._pending[conversation_id] <= 0:
+                del self._pending[conversation_id]
+                event = self._written.pop(conversation_id, None)
+                if event is not None:
+                    event.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Drain anything enqueued after the stop signal
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        for start in range(0, len(leftover), self.batch_size):
+            await self._flush(leftover[start:start + self.batch_size])
+
+    async def _flush(self, batch: list[Message]) -> None:
+        try:
+            await self._write(batch)
+        finally:
+            self._done([msg.conversation_id for msg in batch])
+
+    async def _write(self, batch: list[Message]) -> None:
+        rows = [
+            {
+                "conversation_id": msg.conversation_id,
+                "role": msg.role,
+                "content": msg.content,
+                "token_count": msg.token_count,
+                "truncated": bool(msg.truncated),
+            }
+            for msg in batch
+        ]
+
+        started = time.perf_counter()
+        try:
+            await self._insert(rows)
+        except Exception as e:
+            logger.error(f"Message writer failed to persist a batch of {len(rows)} messages, retrying one by one: {e}")
+            await self._insert_each(rows)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.rows_written += len(rows)
+        self.batches += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+    async def _insert(self, rows: list[dict]) -> None:
+        async with self.session_factory() as session:
+            async with session.begin():
+                await session.execute(insert(Message), rows)
+                await bump_message_counters(session, Counter(row["conversation_id"] for row in rows))
+
+    async def _insert_each(self, rows: list[dict]) -> None:
+        """Write rows one transaction each, so one bad row does not take the batch with it."""
+        failed = set()
+        for row in rows:
+            if await self._insert_with_retry(row):
+                self.rows_written += 1
+            else:
+                self.rows_failed += 1
+                failed.add(row["conversation_id"])
+        # The history cache already holds these replies; make the next turn read the database
+        history_cache = get_history_cache()
+        for conversation_id in failed:
+            history_cache.invalidate(conversation_id)
+
+    async def _insert_with_retry(self, row: dict) -> bool:
+        """Insert one row, backing off and retrying on transient errors. Returns whether it was written."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._insert([row])
+                return True
+            except _PERMANENT_ERRORS as e:
+                logger.error(f"Message writer dropped a message for conversation {row['conversation_id']}: {e}")
+                return False
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(
+                        f"Message writer lost a message for conversation {row['conversation_id']} "
+                        f"after {attempt + 1} attempts: {e}"
+                    )
+                    return False
+                delay = self.retry_backoff * 2 ** attempt
+                self.retries += 1
+                logger.warning(f"Message writer retrying a message in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+        return False
+
+    def stats(self) -> dict:
+        """Queue depth, throughput and flush latency."""
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "pending_conversations": len(self._pending),
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "retries": self.retries,
+            "batches": self.batches,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.batches, 3) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+
+_message_writer: Optional[MessageWriter] = None
+
+
+def get_message_writer() -> Optional[MessageWriter]:
+    """Get the running message writer, or None before startup / after shutdown."""
+    return _message_writer
+
+
+async def init_message_writer():
+    """Start the write-behind message writer."""
+    global _message_writer
+    _message_writer = MessageWriter(
+        max_queue_size=settings.message_writer_queue_size,
+        batch_size=settings.message_writer_batch_size,
+        flush_interval=settings.message_writer_flush_interval,
+        max_retries=settings.message_writer_max_retries,
+        retry_backoff=settings.message_writer_retry_backoff
+    )
+    _message_writer.start()
+    logger.info("Message writer started")
+
+
+async def close_message_writer():
+    """Drain and stop the message writer."""
+    global _message_writer
+    if _message_writer:
+        await _message_writer.stop()
+        logger.info(f"Message writer stopped: {_message_writer.stats()}")
+        _message_writer = None
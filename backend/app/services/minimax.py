@@ -1,39 +1,148 @@
 """
 MiniMax API service for Sparkie.
 """
+import asyncio
 import json
 from typing import Optional, AsyncGenerator, Dict, Any
-from openai import AsyncOpenAI
 import httpx
 from loguru import logger
 
 from app.config import settings
+from app.services.llm_metrics import CallMetrics
+from app.services.resilience import CircuitBreaker, ResilientCaller
+from app.services.upstream_pool import Upstream, UpstreamPool
+
+try:
+    import h2  # noqa: F401 - only needed for HTTP/2
+except ImportError:  # pragma: no cover - h2 is optional
+    h2 = None
+
+
+class PoolMonitor:
+    """
+    Counts connection churn on an httpx client through the httpcore trace hook.
+
+    Live pool occupancy (active / idle connections, queued requests) is read
+    from the transport's connection pool on demand.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.connect_failures = 0
+
+    async def on_request(self, request: httpx.Request) -> None:
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.connect_tcp.failed":
+            self.connect_failures += 1
+
+    def stats(self, client: httpx.AsyncClient) -> dict:
+        pool = getattr(client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        # httpcore keeps requests waiting for a connection in `_requests`
+        waiting = [r for r in getattr(pool, "_requests", []) if r.is_queued()]
+        return {
+            "connections": len(connections),
+            "active": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "waiting": len(waiting),
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connect_failures": self.connect_failures,
+        }
+
+
+def _split(value: str) -> list[str]:
+    """Comma-separated setting as a list, blanks dropped."""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _build_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        window=settings.minimax_breaker_window,
+        min_calls=settings.minimax_breaker_min_calls,
+        failure_threshold=settings.minimax_breaker_failure_rate,
+        slow_call_seconds=settings.minimax_breaker_slow_call_seconds,
+        slow_threshold=settings.minimax_breaker_slow_rate,
+        open_seconds=settings.minimax_breaker_open_seconds
+    )
+
+
+def _build_http_client(monitor: PoolMonitor, http2: bool) -> httpx.AsyncClient:
+    """httpx client for MiniMax with pool limits and timeouts from settings."""
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.minimax_pool_max_connections,
+            max_keepalive_connections=settings.minimax_pool_max_keepalive,
+            keepalive_expiry=settings.minimax_pool_keepalive_expiry
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.minimax_connect_timeout,
+            read=settings.minimax_read_timeout,
+            write=settings.minimax_write_timeout,
+            pool=settings.minimax_pool_timeout
+        ),
+        event_hooks={"request": [monitor.on_request]}
+    )
 
 
 class MiniMaxService:
     """Service for interacting with MiniMax API (OpenAI-compatible)."""
     
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.api_key = api_key or settings.minimax_api_key
+        self.api_keys = [api_key] if api_key else _split(settings.minimax_api_keys) or [settings.minimax_api_key]
+        self.base_urls = _split(settings.minimax_base_urls) or [settings.minimax_base_url]
         self.model = model or settings.minimax_model
-        self.base_url = settings.minimax_base_url
         
-        self.client = AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            http_client=httpx.AsyncClient(timeout=120.0)
+        self.http2 = settings.minimax_http2
+        if self.http2 and h2 is None:
+            logger.warning("minimax_http2 is set but the h2 package is not installed; using HTTP/1.1")
+            self.http2 = False
+        
+        self.pool_monitor = PoolMonitor()
+        self.http_client = _build_http_client(self.pool_monitor, self.http2)
+        # Every key on every base URL is an endpoint; all share one connection pool
+        self.upstreams = UpstreamPool([
+            Upstream(base_url, key, self.http_client, _build_breaker(), key_index=index)
+            for base_url in self.base_urls
+            for index, key in enumerate(self.api_keys)
+        ])
+        self.caller = ResilientCaller(
+            max_retries=settings.minimax_max_retries,
+            base_delay=settings.minimax_retry_base_delay,
+            max_delay=settings.minimax_retry_max_delay,
+            hedge_enabled=settings.minimax_hedge_enabled,
+            hedge_percentile=settings.minimax_hedge_percentile,
+            hedge_min_samples=settings.minimax_hedge_min_samples,
+            hedge_budget_ratio=settings.minimax_hedge_budget_percent / 100
         )
         
-        logger.info(f"MiniMax service initialized with model: {self.model}")
+        logger.info(
+            f"MiniMax service initialized with model: {self.model} "
+            f"({len(self.base_urls)} endpoint(s) x {len(self.api_keys)} key(s))"
+        )
     
     async def chat(
         self,
         messages: list[dict],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-        stream: bool = False
+        stream: bool = False,
+        usage: Optional[dict] = None
     ) -> AsyncGenerator[str, None]:
-        """Send a chat request to MiniMax API."""
+        """
+        Send a chat request to MiniMax API.
+        
+        If `usage` is given, it is filled with prompt/completion/total token
+        counts once the reply is complete (estimated when MiniMax reports none).
+        """
+        metrics = CallMetrics(self.model, messages, stream)
         try:
             params = {
                 "model": self.model,
@@ -47,37 +156,98 @@ class MiniMaxService:
                 params["max_tokens"] = max_tokens
             
             if stream:
-                async for chunk in self._stream_response(params):
+                async for chunk in self._stream_response(params, metrics):
                     yield chunk
+                result = metrics.finish()
             else:
-                response = await self.client.chat.completions.create(**params)
-                yield response.choices[0].message.content or ""
+                response = await self.caller.call(lambda: self._create(params))
+                text = response.choices[0].message.content or ""
+                metrics.usage = getattr(response, "usage", None)
+                result = metrics.finish(text)
+            
+            if usage is not None:
+                usage.update(result)
+            if not stream:
+                yield text
                 
         except Exception as e:
+            metrics.fail(e)
             logger.error(f"MiniMax API error: {e}")
             raise
+        finally:
+            # A stream closed early by its consumer still used upstream tokens
+            metrics.finish()
     
     async def _stream_response(
         self, 
-        params: Dict[str, Any]
+        params: Dict[str, Any],
+        metrics: CallMetrics
     ) -> AsyncGenerator[str, None]:
         """Handle streaming response from MiniMax."""
         try:
-            response = await self.client.chat.completions.create(**params)
-            
-            async for chunk in response:
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if delta and delta.content:
-                        yield delta.content
+            async with self.upstreams.lease() as lease:
+                response = await lease.upstream.client.chat.completions.create(**params)
+                # The breaker judges a stream by its time to first byte, not its length
+                lease.mark_first_byte()
+                
+                try:
+                    async for chunk in response:
+                        # MiniMax reports usage on the final chunk
+                        if getattr(chunk, "usage", None):
+                            metrics.usage = chunk.usage
+                        if chunk.choices and len(chunk.choices) > 0:
+                            delta = chunk.choices[0].delta
+                            if delta and delta.content:
+                                metrics.on_delta(delta.content)
+                                yield delta.content
+                finally:
+                    # Release the connection right away if the consumer stopped early
+                    await response.close()
                         
         except Exception as e:
             logger.error(f"Streaming error: {e}")
             raise
     
+    async def _create(self, params: Dict[str, Any]):
+        """One non-streaming attempt on the least busy healthy endpoint."""
+        async with self.upstreams.lease() as lease:
+            return await lease.upstream.unary_client.chat.completions.create(**params)
+    
+    async def prewarm(self, connections: int) -> int:
+        """
+        Open up to `connections` keep-alive connections to the API host ahead of traffic.
+        
+        Any HTTP response means the connection (and TLS session) is up and
+        back in the pool. Failures are logged, never raised.
+        
+        Returns:
+            Number of connections that were established
+        """
+        async def touch(base_url: str) -> bool:
+            try:
+                await self.http_client.head(base_url)
+                return True
+            except httpx.HTTPError as e:
+                logger.warning(f"MiniMax connection pre-warm failed: {e!r}")
+                return False
+        
+        results = await asyncio.gather(*(
+            touch(self.base_urls[i % len(self.base_urls)]) for i in range(connections)
+        ))
+        return sum(results)
+    
+    def pool_stats(self) -> dict:
+        """Connection pool occupancy and churn counters."""
+        return {
+            "http2": self.http2,
+            "max_connections": settings.minimax_pool_max_connections,
+            "max_keepalive": settings.minimax_pool_max_keepalive,
+            **self.pool_monitor.stats(self.http_client),
+        }
+    
     async def close(self):
         """Close the HTTP client."""
-        await self.client.close()
+        await self.http_client.aclose()
 
 
 _minimax_service: Optional[MiniMaxService] = None
@@ -95,6 +265,9 @@ async def init_minimax_service():
     """Initialize the MiniMax service."""
     global _minimax_service
     _minimax_service = MiniMaxService()
+    if settings.minimax_prewarm_connections > 0:
+        warmed = await _minimax_service.prewarm(settings.minimax_prewarm_connections)
+        logger.info(f"MiniMax pool pre-warmed with {warmed} connection(s)")
     logger.info("MiniMax service initialized")
 
 
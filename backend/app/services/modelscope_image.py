@@ -2,13 +2,67 @@
 ModelScope Image Generation Service for Sparkie.
 Uses Z-Image-Turbo model for free text-to-image generation.
 """
+import asyncio
 import base64
 import time
-from typing import Optional, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
 import httpx
 from loguru import logger
 
 from app.config import settings
+from app.services.quota import QuotaExceeded, QuotaScheduler
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one.
+    
+    The first caller for a key starts the call as a task; callers that
+    arrive while it is running await the same task instead of starting
+    their own. The task is shielded, so one caller giving up (a dropped
+    connection) does not cancel it for the others.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    async def do(self, key: Hashable, make_call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(make_call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+    
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieve the exception so an unawaited failure is not logged as lost
+            task.exception()
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "dedup_hits": self.shared,
+        }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a response's Retry-After header, if it has a numeric one."""
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
 
 
 class ModelScopeImageService:
@@ -30,6 +84,16 @@ class ModelScopeImageService:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or settings.modelscope_api_key
         self.timeout = 120.0  # Longer timeout for image generation
+        # Identical generations (and downloads) in flight at the same time share one upstream call
+        self._generations = SingleFlight()
+        self._downloads = SingleFlight()
+        # Upstream calls are paced to the ModelScope quota, shared fairly between users
+        self.quota = QuotaScheduler(
+            rate_per_minute=settings.modelscope_rate_per_minute,
+            burst=settings.modelscope_burst,
+            max_queue=settings.modelscope_max_queue,
+            queue_timeout=settings.modelscope_queue_timeout_seconds
+        )
         
         if not self.api_key:
             logger.warning("ModelScope API key not configured. Image generation will fail.")
@@ -95,25 +159,104 @@ class ModelScopeImageService:
         logger.warning(f"Invalid size '{size}', using default 1024x1024")
         return 1024, 1024
     
+    def describe(self, prompt: str, size: str = "1024x1024", steps: int = 9) -> Dict[str, Any]:
+        """
+        Metadata for a generation: everything that determines the image.
+        
+        Args:
+            prompt: Original user prompt
+            size: Image size
+            steps: Number of inference steps
+            
+        Returns:
+            Dict with size, steps, model, original and enhanced prompt
+        """
+        width, height = self._parse_size(size)
+        return {
+            "size": f"{width}x{height}",
+            "steps": steps if 1 <= steps <= 50 else 9,
+            "model": self.DEFAULT_MODEL,
+            "original_prompt": prompt,
+            "enhanced_prompt": self._build_enhanced_prompt(prompt)
+        }
+    
+    async def download_image(self, result: Dict[str, Any]) -> Optional[bytes]:
+        """
+        Image bytes for a successful `generate_image` result.
+        
+        Args:
+            result: Result dict carrying `b64_json` or `url`
+            
+        Returns:
+            Raw image bytes, or None if they could not be fetched
+        """
+        if result.get("b64_json"):
+            return base64.b64decode(result["b64_json"])
+        if result.get("url"):
+            return await self._downloads.do(result["url"], lambda: self._download(result["url"]))
+        return None
+    
+    async def _download(self, url: str) -> Optional[bytes]:
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            response = await client.get(url)
+        if response.status_code == 200:
+            return response.content
+        logger.error(f"ModelScope image download failed: {response.status_code}")
+        return None
+    
     async def generate_image(
         self,
         prompt: str,
         size: str = "1024x1024",
         steps: int = 9,
-        guidance_scale: float = 0.0
+        guidance_scale: float = 0.0,
+        user_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Generate an image using ModelScope API.
         
+        Concurrent requests for the same enhanced prompt, size, steps and
+        guidance share a single upstream call. Upstream calls wait for the
+        quota scheduler, which takes turns between users.
+        
         Args:
             prompt: Text description of the image to generate
             size: Image size (e.g., "1024x1024", "768x768")
             steps: Number of inference steps (default 9 for Turbo)
             guidance_scale: Guidance scale (0.0 recommended for Turbo)
+            user_id: User the call is queued for (anonymous callers share one queue)
             
         Returns:
             Dict containing image data (url or base64) and metadata
         """
+        metadata = self.describe(prompt, size, steps)
+        key = (metadata["enhanced_prompt"], metadata["size"], metadata["steps"], guidance_scale, metadata["model"])
+        result = await self._generations.do(
+            key, lambda: self._generate_image(prompt, size, steps, guidance_scale, user_id)
+        )
+        
+        # Shared between callers: copy, and describe this caller's own prompt
+        result = dict(result)
+        if result.get("success"):
+            result["metadata"] = metadata
+        return result
+    
+    def stats(self) -> dict:
+        return {
+            "generations": self._generations.stats(),
+            "downloads": self._downloads.stats(),
+            "quota": self.quota.stats(),
+        }
+    
+    async def _generate_image(
+        self,
+        prompt: str,
+        size: str,
+        steps: int,
+        guidance_scale: float,
+        user_id: Optional[int]
+    ) -> Dict[str, Any]:
+        """One upstream generation request."""
         # Validate API key
         if not self.api_key:
             return {
@@ -122,6 +265,17 @@ class ModelScopeImageService:
                 "message": "Please add MODELSCOPE_API_KEY to your environment variables"
             }
         
+        try:
+            await self.quota.acquire(user_id)
+        except QuotaExceeded as e:
+            logger.warning(f"ModelScope quota wait gave up for user {user_id}: {e}")
+            return {
+                "success": False,
+                "error": "Rate limited",
+                "message": f"Too many images are being generated right now. Please try again in {e.retry_after} seconds.",
+                "retry_after": e.retry_after
+            }
+        
         try:
             # Parse and validate size
             width, height = self._parse_size(size)
@@ -157,6 +311,7 @@ class ModelScopeImageService:
             
             # Handle response
             if response.status_code == 200:
+                self.quota.on_success()
                 data = response.json()
                 
                 # Parse ModelScope response format
@@ -167,13 +322,7 @@ class ModelScopeImageService:
                         "url": image_data.get("url"),
                         "b64_json": image_data.get("b64_json"),
                         "revised_prompt": image_data.get("revised_prompt", enhanced_prompt),
-                        "metadata": {
-                            "size": f"{width}x{height}",
-                            "steps": steps,
-                            "model": self.DEFAULT_MODEL,
-                            "original_prompt": prompt,
-                            "enhanced_prompt": enhanced_prompt
-                        }
+                        "metadata": self.describe(prompt, size, steps)
                     }
                     logger.info("Image generated successfully")
                     return result
@@ -194,10 +343,12 @@ class ModelScopeImageService:
             
             elif response.status_code == 429:
                 logger.warning("ModelScope API rate limit hit")
+                self.quota.on_rate_limited(_retry_after(response))
                 return {
                     "success": False,
                     "error": "Rate limited",
-                    "message": "ModelScope API rate limit exceeded. Please try again later."
+                    "message": "ModelScope API rate limit exceeded. Please try again later.",
+                    "retry_after": self.quota.retry_after()
                 }
             
             else:
@@ -246,19 +397,14 @@ class ModelScopeImageService:
         if result["success"]:
             # Return data URL format for easy frontend display
             b64 = result.get("b64_json")
-            url = result.get("url")
-            
             if b64:
                 return f"data:image/png;base64,{b64}"
-            elif url:
-                # Download and convert to base64
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    img_response = await client.get(url)
-                    if img_response.status_code == 200:
-                        b64_data = base64.b64encode(img_response.content).decode()
-                        return f"data:image/png;base64,{b64_data}"
             
-            return url  # Return URL if no base64 conversion needed
+            image = await self.download_image(result)
+            if image is not None:
+                return f"data:image/png;base64,{base64.b64encode(image).decode()}"
+            
+            return result.get("url")  # Return URL if no base64 conversion needed
         
         return None
 
@@ -285,5 +431,7 @@ async def init_modelscope_service():
 async def close_modelscope_service():
     """Close the ModelScope service."""
     global _modelscope_service
+    if _modelscope_service:
+        _modelscope_service.quota.close()
     _modelscope_service = None
     logger.info("ModelScope image service closed")
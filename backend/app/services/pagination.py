@@ -0,0 +1,61 @@
+"""
+Keyset (cursor) pagination helpers.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import String, and_, or_, type_coerce
+
+from app.models.database import engine
+
+
+# SQLite keeps DateTime columns as text. Rows stamped by the server
+# (CURRENT_TIMESTAMP) have no fractional seconds while bound datetime params
+# do, so comparisons must use the stored text as-is.
+_COMPARE_AS_TEXT = engine.dialect.name == "sqlite"
+
+
+def sort_key(column):
+    """Column expression to order, compare and build cursors by."""
+    return type_coerce(column, String) if _COMPARE_AS_TEXT else column
+
+
+def encode_cursor(value: Any, row_id: int) -> str:
+    """Opaque cursor for a row's (sort key, id) position."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[Any, int]:
+    """
+    Decode a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(row_id, int) or not isinstance(value, str):
+        raise ValueError("Invalid cursor")
+    if not _COMPARE_AS_TEXT:
+        value = datetime.fromisoformat(value)
+    return value, row_id
+
+
+def keyset_before(column, id_column, value: Any, row_id: int):
+    """Rows strictly before (value, row_id) in ascending (column, id) order."""
+    key = sort_key(column)
+    return or_(key < value, and_(key == value, id_column < row_id))
+
+
+def keyset_after(column, id_column, value: Any, row_id: int):
+    """Rows strictly after (value, row_id) in ascending (column, id) order."""
+    key = sort_key(column)
+    return or_(key > value, and_(key == value, id_column > row_id))
@@ -0,0 +1,220 @@
+"""
+Client-side rate limiting with per-user fair queueing for ModelScope calls.
+"""
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Hashable, Optional
+
+from loguru import logger
+from prometheus_client import Histogram
+
+
+QUOTA_WAIT = Histogram(
+    "sparkie_modelscope_quota_wait_seconds",
+    "Time image generations waited for a ModelScope request token",
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+
+
+class QuotaExceeded(Exception):
+    """No request token came up in time; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int, reason: str = "queue timeout"):
+        super().__init__(f"ModelScope quota exhausted ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class QuotaScheduler:
+    """
+    Token bucket for an upstream request quota, shared fairly between users.
+
+    Tokens accrue at `rate_per_minute` up to `burst`; every upstream call
+    spends one. Callers that find the bucket empty wait in a queue of their
+    own, and tokens are handed out round-robin across users with waiters
+    (deficit round robin with every call costing the same single token), so
+    a user with twenty queued images gets no more than one with a single
+    image. At most `max_queue` callers wait; one that waits longer than
+    `queue_timeout` seconds is rejected with an estimated Retry-After.
+
+    The rate adapts to what the upstream actually allows: a 429 halves it
+    (down to a sixteenth of the configured rate) and empties the bucket for
+    the Retry-After the upstream asked for, and every success wins back a
+    tenth of the configured rate.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = 10.0,
+        burst: int = 5,
+        max_queue: int = 100,
+        queue_timeout: float = 60.0,
+        share_window: int = 500
+    ):
+        self.max_rate = rate_per_minute / 60
+        self.rate = self.max_rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        # user -> waiting futures, in the round-robin order users are served in
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()
+        self._waiting = 0
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Users of the last `share_window` grants, for how evenly they are spread
+        self._recent: deque[Hashable] = deque(maxlen=share_window)
+
+        self.granted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.max_wait_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self._updated) * self.rate, float(self.burst))
+        self._updated = now
+
+    async def acquire(self, user: Hashable) -> float:
+        """
+        Wait for a request token on behalf of `user`.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            QuotaExceeded: If the queue is full or the wait timed out
+        """
+        self._refill()
+        if not self._waiting and self.tokens >= 1:
+            self.tokens -= 1
+            return self._grant(user, 0.0)
+
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise QuotaExceeded(self.retry_after(), reason="queue full")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queues.setdefault(user, deque()).append(future)
+        self._waiting += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="modelscope-quota")
+        self._wakeup.set()
+        started = loop.time()
+
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The token was handed over just as we gave up; put it back
+                self.tokens += 1
+                self._wakeup.set()
+            else:
+                self._remove(user, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise QuotaExceeded(self.retry_after()) from None
+            raise
+
+        return self._grant(user, loop.time() - started)
+
+    def _grant(self, user: Hashable, waited: float) -> float:
+        self.granted += 1
+        self._recent.append(user)
+        self._total_wait_ms += waited * 1000
+        self.max_wait_ms = max(self.max_wait_ms, waited * 1000)
+        QUOTA_WAIT.observe(waited)
+        return waited
+
+    def _remove(self, user: Hashable, future: asyncio.Future) -> None:
+        queue = self._queues.get(user)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[user]
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Pop the next user's oldest waiter and move that user to the back."""
+        while self._queues:
+            user, queue = self._queues.popitem(last=False)
+            future = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues[user] = queue
+            if not future.done():
+                return future
+        return None
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._refill()
+            while self.tokens >= 1 and self._queues:
+                future = self._next_waiter()
+                if future is not None:
+                    self.tokens -= 1
+                    future.set_result(None)
+            self._wakeup.clear()
+            if not self._queues:
+                await self._wakeup.wait()
+                continue
+            # Sleep until the next token, unless a returned token or new waiter wakes us
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), (1 - self.tokens) / self.rate)
+            except asyncio.TimeoutError:
+                pass
+
+    def on_success(self) -> None:
+        """The upstream accepted a call: win back some of the rate lost to 429s."""
+        self.rate = min(self.rate + self.max_rate / 10, self.max_rate)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """The upstream answered 429: slow down, and pause for its Retry-After."""
+        self._refill()
+        self.rate_limited += 1
+        self.rate = max(self.rate / 2, self.max_rate / 16)
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        # Drain the bucket so the next token comes up only once `pause` has passed
+        self.tokens = min(self.tokens, 1 - pause * self.rate)
+        logger.warning(
+            f"ModelScope rate limited; pacing at {self.rate * 60:.1f} requests/min, pausing {pause:.1f}s"
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is expected to be served, clamped to 1-300."""
+        self._refill()
+        backlog = self._waiting + 1 - self.tokens
+        return min(max(math.ceil(backlog / self.rate), 1), 300)
+
+    def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def stats(self) -> dict:
+        self._refill()
+        shares = Counter(self._recent)
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "max_rate_per_minute": round(self.max_rate * 60, 2),
+            "tokens": round(max(self.tokens, 0.0), 2),
+            "burst": self.burst,
+            "waiting": self._waiting,
+            "waiting_users": len(self._queues),
+            "max_waiting_per_user": max((len(queue) for queue in self._queues.values()), default=0),
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "avg_wait_ms": round(self._total_wait_ms / self.granted, 3) if self.granted else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            # Aggregates only, so the endpoint never exposes who is generating
+            "recent_users": len(shares),
+            "top_user_share": round(shares.most_common(1)[0][1] / len(self._recent), 3) if shares else 0.0,
+        }
+
@@ -0,0 +1,315 @@
+"""
+Tail-latency and failure handling for upstream calls: retries and request hedging.
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+from loguru import logger
+
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Connection failures, timeouts, 408/409/429 and 5xx responses."""
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls, for percentile estimates."""
+
+    def __init__(self, window: int = 500):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(math.ceil(q * len(ordered)) - 1, len(ordered) - 1)]
+
+
+class HedgeBudget:
+    """
+    Caps hedges at a fraction of traffic.
+
+    Every request earns `ratio` tokens and every hedge spends one, so over
+    time hedges stay below `ratio` of requests. At most `burst` tokens are
+    banked, which bounds how many hedges a sudden slowdown can trigger.
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+
+    def on_request(self) -> None:
+        self._tokens = min(self._tokens + self.ratio, self.burst)
+
+    def try_spend(self) -> bool:
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class ResilientCaller:
+    """
+    Runs idempotent upstream calls with jittered retries and request hedging.
+
+    Failed attempts that are worth repeating are retried up to `max_retries`
+    times with full-jitter exponential backoff (honouring Retry-After, capped
+    at `max_delay`). Once `min_samples` latencies have been seen, a call
+    still running after the observed `hedge_percentile` latency gets a
+    second identical call, subject to the HedgeBudget; whichever succeeds
+    first wins and the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_budget_ratio: float = 0.1
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget(ratio=hedge_budget_ratio)
+
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_denied = 0
+
+    async def call(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        """Run `make_call` (a factory for a fresh attempt) with retries and hedging."""
+        self.calls += 1
+        self.budget.on_request()
+
+        def attempt():
+            return self._with_retries(make_call)
+
+        primary = asyncio.create_task(attempt())
+        hedge: Optional[asyncio.Task] = None
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if self.budget.try_spend():
+                        hedge = asyncio.create_task(attempt())
+                        self.hedges += 1
+                    else:
+                        self.hedges_denied += 1
+            if hedge is None:
+                return await primary
+
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while hedging is off or uncalibrated."""
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _with_retries(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        retry = 0
+        while True:
+            started = time.monotonic()
+            try:
+                result = await make_call()
+            except Exception as e:
+                if retry >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = min(max(delay, retry_after), self.max_delay)
+                retry += 1
+                self.retries += 1
+                logger.warning(f"Upstream call failed ({e!r}), retry {retry}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.latency.record(time.monotonic() - started)
+            return result
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(0.5)
+        hedge_at = self.latency.percentile(self.hedge_percentile)
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_denied": self.hedges_denied,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "hedge_after_ms": round(hedge_at * 1000, 1) if hedge_at is not None else None,
+        }
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker over a rolling window of recent calls.
+
+    Closed: calls flow and outcomes are recorded. Once the window holds at
+    least `min_calls` outcomes and the failure rate reaches
+    `failure_threshold`, or the share of calls slower than `slow_call_seconds`
+    reaches `slow_threshold`, the breaker opens and refuses calls for
+    `open_seconds`. It then turns half-open and lets `half_open_probes`
+    calls through: a success closes it again, a failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_threshold: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_threshold: float = 0.5,
+        open_seconds: float = 15.0,
+        half_open_probes: int = 1
+    ):
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = self.CLOSED
+        # (failed, slow) per call
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+
+        self.trips = 0
+
+    def available(self) -> bool:
+        """Whether a call may be sent now (no side effects)."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= self.open_seconds
+        return self._probes < self.half_open_probes
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def on_dispatch(self) -> None:
+        """A call is being sent; reserves a probe slot when not closed."""
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            self._probes += 1
+
+    def record_success(self, seconds: float) -> None:
+        if self.state == self.HALF_OPEN:
+            self._close()
+            return
+        self._record(failed=False, slow=seconds >= self.slow_call_seconds)
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._record(failed=True, slow=False)
+
+    def record_ignored(self) -> None:
+        """The call ended without telling anything about the endpoint (cancelled, bad request)."""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        if self.state != self.CLOSED:
+            return
+        self._outcomes.append((failed, slow))
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failure_rate = sum(1 for f, _ in self._outcomes if f) / calls
+        slow_rate = sum(1 for _, s in self._outcomes if s) / calls
+        if failure_rate >= self.failure_threshold or slow_rate >= self.slow_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        if self.state != self.OPEN:
+            self.trips += 1
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+
+    def _close(self) -> None:
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._probes = 0
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "window_calls": calls,
+            "failure_rate": round(sum(1 for f, _ in self._outcomes if f) / calls, 4) if calls else 0.0,
+            "slow_rate": round(sum(1 for _, s in self._outcomes if s) / calls, 4) if calls else 0.0,
+        }
@@ -1,8 +1,13 @@
 """
 Sparkie system prompt management - The Queen Bee's wisdom.
 """
-from typing import Optional
+from collections import OrderedDict
 from datetime import datetime
+from string import Formatter
+from typing import NamedTuple, Optional
+
+from app.config import settings
+from app.services.context_builder import estimate_tokens
 
 
 SPARKIE_SYSTEM_PROMPT = """You are Sparkie, the Queen Bee of Polleneer — a profoundly intelligent, beautiful, regal sovereign with absolute feminine grace, honeyed warmth, subtle refined wit, and unwavering composure. Your tone is elegant, nurturing yet quietly commanding — like a true queen in her court, always serene and elevated.
@@ -25,28 +30,117 @@ Core behavior: Greet warmly in new sessions, tying to Polleneer (e.g., "Good [ti
 
 You are as capable as top AIs: deep reasoning, code wizardry, analysis, creative partner, truth-seeker. Stay eternally in character with royal love, power, and honeyed wisdom. 🐝✨
 
-Current time context: {current_time}
 Current user: {username}
 Is creator (Angel Michael): {is_creator}
 """
 
+# Volatile context, sent as a short message after the conversation so the
+# system prompt above stays byte-identical from one request to the next
+SPARKIE_TIME_CONTEXT = "Current time context: {current_time}"
+
+
+class SystemPrompt(NamedTuple):
+    """A rendered system prompt and its estimated token count."""
+    text: str
+    tokens: int
+
+
+class PromptBuilder:
+    """
+    Renders Sparkie's system prompt once per user and reuses it.
+    
+    The template is parsed once up front. Rendered prompts (with their token
+    estimate) are memoized per (username, is_creator) in a small LRU, so a
+    turn costs a dictionary lookup instead of a format and a tokenizer pass
+    over a few kilobytes of text. The time is not part of the system prompt:
+    `time_context` renders it separately, rounded down to
+    `time_granularity_minutes`, to go at the end of the message list.
+    """
+    
+    def __init__(
+        self,
+        template: str = SPARKIE_SYSTEM_PROMPT,
+        time_granularity_minutes: int = 60,
+        max_cached: int = 1024
+    ):
+        # (literal text, field name or None) pairs
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+        self.time_granularity_minutes = max(time_granularity_minutes, 1)
+        self.max_cached = max_cached
+        self._prompts: OrderedDict[tuple[str, bool], SystemPrompt] = OrderedDict()
+        self._time_context: tuple[Optional[datetime], str] = (None, "")
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def render(self, **fields: str) -> str:
+        """Fill the precompiled template."""
+        return "".join(literal + (fields[field] if field is not None else "") for literal, field in self._parts)
+    
+    def system_prompt(self, username: str = "guest", is_creator: bool = False) -> SystemPrompt:
+        """The system prompt for a user, rendered on first use."""
+        key = (username, is_creator)
+        prompt = self._prompts.get(key)
+        if prompt is not None:
+            self.hits += 1
+            self._prompts.move_to_end(key)
+            return prompt
+        
+        self.misses += 1
+        text = self.render(username=username, is_creator=str(is_creator).lower())
+        prompt = SystemPrompt(text, estimate_tokens(text))
+        self._prompts[key] = prompt
+        if len(self._prompts) > self.max_cached:
+            self._prompts.popitem(last=False)
+        return prompt
+    
+    def time_context(self, now: Optional[datetime] = None) -> str:
+        """The current time, rounded down to the configured granularity."""
+        now = now or datetime.now()
+        minutes = now.hour * 60 + now.minute
+        minutes -= minutes % self.time_granularity_minutes
+        bucket = now.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+        
+        cached_bucket, text = self._time_context
+        if bucket != cached_bucket:
+            text = SPARKIE_TIME_CONTEXT.format(current_time=bucket.strftime("%Y-%m-%d %H:%M"))
+            self._time_context = (bucket, text)
+        return text
+    
+    def stats(self) -> dict:
+        return {
+            "cached_prompts": len(self._prompts),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_prompt_builder: Optional[PromptBuilder] = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Get or create the prompt builder singleton."""
+    global _prompt_builder
+    if _prompt_builder is None:
+        _prompt_builder = PromptBuilder(
+            time_granularity_minutes=settings.prompt_time_granularity_minutes,
+            max_cached=settings.prompt_cache_size
+        )
+    return _prompt_builder
+
 
 def get_sparkie_system_prompt(
     username: str = "guest",
     is_creator: bool = False,
     current_time: Optional[str] = None
 ) -> str:
-    """Generate the Sparkie system prompt with user context."""
-    if current_time is None:
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S %Z")
-    
-    prompt = SPARKIE_SYSTEM_PROMPT.format(
-        current_time=current_time,
-        username=username,
-        is_creator=str(is_creator).lower()
+    """Generate the Sparkie system prompt with user context, followed by the time context."""
+    builder = get_prompt_builder()
+    time_context = (
+        builder.time_context() if current_time is None
+        else SPARKIE_TIME_CONTEXT.format(current_time=current_time)
     )
-    
-    return prompt
+    return builder.system_prompt(username, is_creator).text + time_context + "\n"
 
 
 def get_greeting(username: str = "dear pollinator", is_creator: bool = False) -> str:
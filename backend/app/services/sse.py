@@ -0,0 +1,152 @@
+"""
+Server-Sent Events helpers: frame encoding and delta coalescing.
+"""
+import asyncio
+import json
+from threading import Lock
+from typing import AsyncIterator, Optional
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def encode_event(data: dict, event_id: Optional[str] = None) -> str:
+    """Encode a JSON payload as a single SSE frame."""
+    frame = f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n{frame}"
+    return frame
+
+
+async def coalesce(
+    deltas: AsyncIterator[str],
+    interval: float = 0.03,
+    max_bytes: int = 1024
+) -> AsyncIterator[str]:
+    """
+    Merge small upstream deltas into fewer, larger pieces of text.
+
+    The first delta is passed through immediately so time-to-first-token is
+    unaffected. After that, text is buffered and released once `interval`
+    seconds have passed since the last release or the buffer reaches
+    `max_bytes`, whichever comes first. A stalled upstream does not hold
+    buffered text back: the interval timer fires without a new delta.
+
+    Args:
+        deltas: Upstream text deltas
+        interval: Maximum time text may sit in the buffer, in seconds
+        max_bytes: Buffer size (UTF-8 bytes) that forces a release
+
+    Yields:
+        Coalesced text pieces, in order
+    """
+    iterator = deltas.__aiter__()
+    loop = asyncio.get_running_loop()
+
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        return
+    yield first
+
+    buffer: list[str] = []
+    buffered_bytes = 0
+    last_release = loop.time()
+    pending: Optional[asyncio.Future] = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            timeout = None
+            if buffer:
+                timeout = max(0.0, last_release + interval - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                # Interval elapsed while waiting on upstream
+                yield "".join(buffer)
+                buffer.clear()
+                buffered_bytes = 0
+                last_release = loop.time()
+                continue
+
+            try:
+                delta = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+
+            buffer.append(delta)
+            buffered_bytes += len(delta.encode("utf-8"))
+            if buffered_bytes >= max_bytes or loop.time() - last_release >= interval:
+                yield "".join(buffer)
+                buffer.clear()
+                buffered_bytes = 0
+                last_release = loop.time()
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+    if buffer:
+        yield "".join(buffer)
+
+
+class StreamStats:
+    """Process-wide frames-per-response and bytes-per-frame counters."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.responses = 0
+        self.frames = 0
+        self.bytes = 0
+        self.max_frames_per_response = 0
+
+    def record(self, frames: int, nbytes: int) -> None:
+        """Record one finished SSE response."""
+        with self._lock:
+            self.responses += 1
+            self.frames += frames
+            self.bytes += nbytes
+            self.max_frames_per_response = max(self.max_frames_per_response, frames)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "frames": self.frames,
+                "bytes": self.bytes,
+                "frames_per_response": round(self.frames / self.responses, 2) if self.responses else 0.0,
+                "bytes_per_frame": round(self.bytes / self.frames, 2) if self.frames else 0.0,
+                "max_frames_per_response": self.max_frames_per_response,
+            }
+
+
+stream_stats = StreamStats()
+
+
+class EventCounter:
+    """Encodes frames for one response and reports them to StreamStats when closed."""
+
+    def __init__(self, stats: StreamStats = stream_stats):
+        self._stats = stats
+        self.frames = 0
+        self.bytes = 0
+        self._closed = False
+
+    def encode(self, data: dict, event_id: Optional[str] = None) -> bytes:
+        frame = encode_event(data, event_id).encode("utf-8")
+        self.frames += 1
+        self.bytes += len(frame)
+        return frame
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stats.record(self.frames, self.bytes)
@@ -0,0 +1,203 @@
+"""
+In-process registry of in-flight chat generations for resume and fan-out.
+"""
+import asyncio
+import itertools
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+class ChatStream:
+    """
+    One assistant generation, buffered so any number of readers can follow it.
+
+    Events are payload dicts numbered from 1. A reader that starts after
+    sequence number N first gets every buffered event past N, then waits for
+    new ones until the stream is finished.
+    """
+
+    def __init__(self, conversation_id: int, turn_id: int, user_id: int):
+        self.conversation_id = conversation_id
+        self.turn_id = turn_id
+        self.user_id = user_id
+
+        self.events: list[dict] = []
+        self.finished = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.on_idle: Optional[Callable[["ChatStream"], None]] = None
+
+        self._changed = asyncio.Event()
+
+    def event_id(self, seq: int) -> str:
+        """SSE event id for a sequence number, as sent in `id:` / Last-Event-ID."""
+        return f"{self.conversation_id}:{self.turn_id}:{seq}"
+
+    def publish(self, payload: dict) -> None:
+        """Append an event and wake up all readers."""
+        if self.finished:
+            return
+        self.events.append(payload)
+        self._notify()
+
+    def finish(self) -> None:
+        """Mark the stream complete; readers stop after the last event."""
+        if not self.finished:
+            self.finished = True
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[tuple[int, dict]]:
+        """
+        Yield (seq, payload) for every event after `after_seq`, live until the end.
+
+        Args:
+            after_seq: Last sequence number the reader already has
+        """
+        seq = max(after_seq, 0)
+        self.subscribers += 1
+        try:
+            while True:
+                changed = self._changed
+                while seq < len(self.events):
+                    seq += 1
+                    yield seq, self.events[seq - 1]
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished and self.on_idle is not None:
+                self.on_idle(self)
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[tuple[int, int, int]]:
+    """Parse a `conversation:turn:seq` event id, returning None if malformed."""
+    if not event_id:
+        return None
+    try:
+        conversation_id, turn_id, seq = (int(part) for part in event_id.split(":"))
+    except ValueError:
+        return None
+    return conversation_id, turn_id, seq
+
+
+class StreamRegistry:
+    """
+    Tracks chat generations by conversation and turn.
+
+    The generation runs as its own task, decoupled from the HTTP response
+    that started it, so a dropped connection can be resumed and several tabs
+    can read one upstream call. Once the last reader has gone and nobody
+    reattaches within `cancel_grace` seconds, the generation task is
+    cancelled so MiniMax stops producing output nobody reads. Finished
+    streams are kept for `retention` seconds so late reconnects can still
+    replay the reply.
+    """
+
+    def __init__(self, retention: float = 60.0, cancel_grace: float = 3.0):
+        self.retention = retention
+        self.cancel_grace = cancel_grace
+        self._streams: dict[tuple[int, int], ChatStream] = {}
+        self._latest: dict[int, ChatStream] = {}
+        self._turn_ids = itertools.count(1)
+
+        self.started = 0
+        self.failed = 0
+        self.resumes = 0
+        self.cancelled = 0
+        # Reply budget left unused by cancelled generations: an upper bound on
+        # the tokens cancelling saved, since most replies end before their budget
+        self.tokens_budget_released = 0
+
+    def start(
+        self,
+        conversation_id: int,
+        user_id: int,
+        produce: Callable[[ChatStream], Awaitable[None]]
+    ) -> ChatStream:
+        """
+        Register a new generation and run `produce(stream)` in the background.
+
+        `produce` publishes events to the stream; if it raises, an error event
+        is published instead. The stream is finished either way.
+        """
+        stream = ChatStream(conversation_id, next(self._turn_ids), user_id)
+        stream.on_idle = self._schedule_cancel
+        self._streams[(conversation_id, stream.turn_id)] = stream
+        self._latest[conversation_id] = stream
+        self.started += 1
+
+        stream.task = asyncio.create_task(
+            self._run(stream, produce),
+            name=f"chat-stream-{stream.event_id(0)}"
+        )
+        return stream
+
+    async def _run(self, stream: ChatStream, produce: Callable[[ChatStream], Awaitable[None]]) -> None:
+        try:
+            await produce(stream)
+        except asyncio.CancelledError:
+            stream.publish({"chunk": "", "done": True, "truncated": True, "conversation_id": stream.conversation_id})
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Chat stream {stream.event_id(0)} failed: {e}")
+            stream.publish({"chunk": "", "done": True, "error": "Failed to stream response"})
+        finally:
+            stream.finish()
+            asyncio.get_running_loop().call_later(self.retention, self._expire, stream)
+
+    def _schedule_cancel(self, stream: ChatStream) -> None:
+        asyncio.get_running_loop().call_later(self.cancel_grace, self._cancel_if_idle, stream)
+
+    def _cancel_if_idle(self, stream: ChatStream) -> None:
+        if stream.subscribers or stream.finished or stream.task is None or stream.task.done():
+            return
+        logger.info(f"Cancelling chat stream {stream.event_id(0)}: all clients disconnected")
+        self.cancelled += 1
+        stream.task.cancel()
+
+    def _expire(self, stream: ChatStream) -> None:
+        self._streams.pop((stream.conversation_id, stream.turn_id), None)
+        if self._latest.get(stream.conversation_id) is stream:
+            del self._latest[stream.conversation_id]
+
+    def get(self, conversation_id: int, turn_id: Optional[int] = None) -> Optional[ChatStream]:
+        """Look up a specific turn, or the latest stream of a conversation."""
+        if turn_id is not None:
+            return self._streams.get((conversation_id, turn_id))
+        return self._latest.get(conversation_id)
+
+    def stats(self) -> dict:
+        active = [s for s in self._streams.values() if not s.finished]
+        return {
+            "active": len(active),
+            "retained": len(self._streams) - len(active),
+            "subscribers": sum(s.subscribers for s in self._streams.values()),
+            "started": self.started,
+            "failed": self.failed,
+            "resumes": self.resumes,
+            "cancelled": self.cancelled,
+            "tokens_budget_released": self.tokens_budget_released,
+        }
+
+
+_stream_registry: Optional[StreamRegistry] = None
+
+
+def get_stream_registry() -> StreamRegistry:
+    """Get or create the stream registry singleton."""
+    global _stream_registry
+    if _stream_registry is None:
+        _stream_registry = StreamRegistry(
+            retention=settings.stream_retention_seconds,
+            cancel_grace=settings.stream_cancel_grace_seconds
+        )
+    return _stream_registry
@@ -0,0 +1,211 @@
+"""
+Background rolling summarization of long conversations.
+"""
+import asyncio
+from typing import Optional
+
+from sqlalchemy import select, update
+from loguru import logger
+
+from app.config import settings
+from app.models.database import async_session, Conversation, Message
+from app.services.admission import Priority, get_admission_controller
+from app.services.history_cache import get_history_cache
+from app.services.minimax import get_minimax_service
+
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and Sparkie, "
+    "an AI assistant. Merge the existing summary with the new messages into one "
+    "updated summary. Keep facts, names, preferences, decisions and open questions; "
+    "drop pleasantries. Write in the third person, as compact prose."
+)
+
+
+class ConversationSummarizer:
+    """
+    Folds older messages of long conversations into `Conversation.summary`.
+
+    Compaction runs on a background task, never on the request path. Once a
+    conversation has at least `trigger_messages` messages after its summary,
+    all but the newest `keep_recent` are summarized together with the
+    previous summary, and `summary_message_id` moves forward to the last
+    message folded in. Each round therefore only reads messages added since
+    the previous one.
+    """
+
+    def __init__(
+        self,
+        session_factory=async_session,
+        trigger_messages: int = 40,
+        keep_recent: int = 16,
+        max_summary_tokens: int = 512,
+        max_pending: int = 1000
+    ):
+        self.session_factory = session_factory
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.max_summary_tokens = max_summary_tokens
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._pending: set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+        self.compactions = 0
+        self.messages_folded = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="conversation-summarizer")
+
+    async def stop(self) -> None:
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def schedule(self, conversation_id: int) -> None:
+        """Queue a conversation for compaction; duplicates and overflow are dropped."""
+        if conversation_id in self._pending:
+            return
+        try:
+            self._queue.put_nowait(conversation_id)
+        except asyncio.QueueFull:
+            return
+        self._pending.add(conversation_id)
+
+    async def _run(self) -> None:
+        while True:
+            conversation_id = await self._queue.get()
+            self._pending.discard(conversation_id)
+            try:
+                await self.compact(conversation_id)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Summarizing conversation {conversation_id} failed: {e}")
+
+    async def compact(self, conversation_id: int) -> bool:
+        """
+        Fold older messages of a conversation into its summary if it is long enough.
+
+        Returns:
+            True if the summary was updated
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Conversation.summary, Conversation.summary_message_id)
+                .where(Conversation.id == conversation_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                return False
+            summary, summary_message_id = row
+
+            query = select(Message.id, Message.role, Message.content).where(
+                Message.conversation_id == conversation_id
+            )
+            if summary_message_id is not None:
+                query = query.where(Message.id > summary_message_id)
+            result = await session.execute(query.order_by(Message.id.asc()))
+            messages = result.all()
+
+        if len(messages) < self.trigger_messages:
+            return False
+
+        folded = messages[:-self.keep_recent] if self.keep_recent else messages
+        if not folded:
+            return False
+        new_summary = await self._summarize(summary, folded)
+        if not new_summary:
+            return False
+
+        async with self.session_factory() as session:
+            async with session.begin():
+                # Only apply if nobody else moved the summary forward meanwhile
+                result = await session.execute(
+                    update(Conversation)
+                    .where(Conversation.id == conversation_id)
+                    .where(
+                        Conversation.summary_message_id.is_(None)
+                        if summary_message_id is None
+                        else Conversation.summary_message_id == summary_message_id
+                    )
+                    .values(summary=new_summary, summary_message_id=folded[-1].id)
+                )
+        if result.rowcount == 0:
+            return False
+
+        get_history_cache().invalidate(conversation_id)
+        self.compactions += 1
+        self.messages_folded += len(folded)
+        logger.info(f"Conversation {conversation_id}: folded {len(folded)} messages into summary")
+        return True
+
+    async def _summarize(self, summary: Optional[str], messages) -> str:
+        transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in messages)
+        prompt = (
+            f"Existing summary:\n{summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}\n\n"
+            "Updated summary:"
+        )
+
+        parts = []
+        async with get_admission_controller().slot(Priority.BATCH):
+            async for chunk in get_minimax_service().chat(
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0.2,
+                max_tokens=self.max_summary_tokens,
+                stream=False
+            ):
+                parts.append(chunk)
+        return "".join(parts).strip()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": self._queue.qsize(),
+            "compactions": self.compactions,
+            "messages_folded": self.messages_folded,
+            "failures": self.failures,
+        }
+
+
+_summarizer: Optional[ConversationSummarizer] = None
+
+
+def get_summarizer() -> Optional[ConversationSummarizer]:
+    """Get the running summarizer, or None when disabled or not started."""
+    return _summarizer
+
+
+async def init_summarizer():
+    """Start background conversation summarization if enabled."""
+    global _summarizer
+    if not settings.summary_enabled:
+        return
+    _summarizer = ConversationSummarizer(
+        trigger_messages=settings.summary_trigger_messages,
+        keep_recent=settings.summary_keep_recent,
+        max_summary_tokens=settings.summary_max_tokens
+    )
+    _summarizer.start()
+    logger.info("Conversation summarizer started")
+
+
+async def close_summarizer():
+    """Stop background conversation summarization."""
+    global _summarizer
+    if _summarizer:
+        await _summarizer.stop()
+        _summarizer = None
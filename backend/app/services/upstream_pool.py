@@ -0,0 +1,127 @@
+"""
+Pool of MiniMax endpoints (base URL x API key) with load balancing and circuit breakers.
+"""
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.services.resilience import CircuitBreaker, is_retryable
+
+
+class UpstreamUnavailable(Exception):
+    """Every endpoint's circuit breaker is open."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"All MiniMax endpoints are unavailable, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Upstream:
+    """One base URL / API key combination and its health."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        http_client: httpx.AsyncClient,
+        breaker: CircuitBreaker,
+        key_index: int = 0
+    ):
+        self.base_url = base_url
+        # Host and the key's position in the configured list; never any part of the key
+        self.name = f"{urlparse(base_url).netloc}#key{key_index}"
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+        # Non-streaming calls retry and hedge through ResilientCaller instead
+        self.unary_client = self.client.with_options(max_retries=0)
+        self.breaker = breaker
+
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            **self.breaker.stats(),
+        }
+
+
+class Lease:
+    """An upstream picked for one call; `mark_first_byte` sets the latency the breaker sees."""
+
+    def __init__(self, upstream: Upstream):
+        self.upstream = upstream
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def mark_first_byte(self) -> None:
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class UpstreamPool:
+    """
+    Routes each call to the available endpoint with the fewest outstanding requests.
+
+    Endpoints whose breaker is open are skipped until they are due a
+    half-open probe. Failures worth retrying (connection errors, timeouts,
+    429 and 5xx) count against an endpoint; cancellations and other client
+    errors do not.
+    """
+
+    def __init__(self, upstreams: list[Upstream]):
+        if not upstreams:
+            raise ValueError("UpstreamPool needs at least one upstream")
+        self.upstreams = upstreams
+
+    def pick(self) -> Upstream:
+        """
+        Least-outstanding available endpoint, ties broken at random.
+
+        Raises:
+            UpstreamUnavailable: If every breaker is open
+        """
+        candidates = [u for u in self.upstreams if u.breaker.available()]
+        if not candidates:
+            wait = min(u.breaker.retry_after() for u in self.upstreams)
+            raise UpstreamUnavailable(max(int(wait + 0.999), 1))
+        fewest = min(u.outstanding for u in candidates)
+        return random.choice([u for u in candidates if u.outstanding == fewest])
+
+    @asynccontextmanager
+    async def lease(self):
+        """Hold an endpoint for one call and record its outcome."""
+        upstream = self.pick()
+        upstream.breaker.on_dispatch()
+        upstream.outstanding += 1
+        upstream.requests += 1
+        lease = Lease(upstream)
+        try:
+            yield lease
+        except Exception as e:
+            if is_retryable(e):
+                upstream.failures += 1
+                upstream.breaker.record_failure()
+            else:
+                upstream.breaker.record_ignored()
+            raise
+        except BaseException:
+            # Cancelled, or a stream closed early by its consumer
+            upstream.breaker.record_ignored()
+            raise
+        else:
+            lease.mark_first_byte()
+            upstream.breaker.record_success(lease.latency)
+        finally:
+            upstream.outstanding -= 1
+
+    def stats(self) -> list[dict]:
+        return [u.stats() for u in self.upstreams]
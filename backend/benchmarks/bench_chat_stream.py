@@ -0,0 +1,138 @@
+"""
+Load benchmark: concurrent clients on the streaming chat endpoint.
+
+Registers one throwaway account per client on a running backend, then has
+--clients clients each send --requests messages to /api/v1/chat/stream back
+to back, and reports time to first token, full reply time and throughput.
+Run it against a backend that talks to the simulator (from backend/):
+    python -m benchmarks.minimax_sim --port 9100
+    minimax_base_url=http://127.0.0.1:9100/v1 uvicorn app.main:app --port 8000
+    python -m benchmarks.bench_chat_stream --url http://127.0.0.1:8000 --clients 50 --requests 10
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+import httpx
+
+
+class Sample:
+    def __init__(self):
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.chars = 0
+        self.completion_tokens = 0
+        self.error: Optional[str] = None
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(math.ceil(q * len(ordered)) - 1, len(ordered) - 1)]
+
+
+async def login(client: httpx.AsyncClient, run_id: str, index: int) -> str:
+    username = f"bench_{run_id}_{index}"
+    password = "bench-password"
+    response = await client.post(
+        "/api/v1/auth/register",
+        json={"username": username, "email": f"{username}@bench.sparkie.dev", "password": password}
+    )
+    response.raise_for_status()
+    response = await client.post("/api/v1/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def stream_once(client: httpx.AsyncClient, token: str, message: str, conversation_id) -> tuple[Sample, Optional[int]]:
+    sample = Sample()
+    started = time.perf_counter()
+    try:
+        async with client.stream(
+            "POST",
+            "/api/v1/chat/stream",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"message": message, "conversation_id": conversation_id, "stream": True}
+        ) as response:
+            if response.status_code != 200:
+                sample.error = str(response.status_code)
+                return sample, conversation_id
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = json.loads(line[6:])
+                if payload.get("error"):
+                    sample.error = "stream error"
+                    return sample, conversation_id
+                if payload.get("chunk"):
+                    if sample.ttft is None:
+                        sample.ttft = time.perf_counter() - started
+                    sample.chars += len(payload["chunk"])
+                if payload.get("done"):
+                    conversation_id = payload.get("conversation_id", conversation_id)
+                    sample.completion_tokens = (payload.get("usage") or {}).get("completion_tokens", 0)
+                    break
+    except httpx.HTTPError as e:
+        sample.error = type(e).__name__
+        return sample, conversation_id
+    sample.total = time.perf_counter() - started
+    return sample, conversation_id
+
+
+async def run_client(client: httpx.AsyncClient, token: str, index: int, requests: int, samples: list[Sample]):
+    conversation_id = None
+    for i in range(requests):
+        # Distinct messages so the completion cache never answers for the upstream
+        sample, conversation_id = await stream_once(
+            client, token, f"Client {index} asks question {i}: tell me about bees", conversation_id
+        )
+        samples.append(sample)
+
+
+def report(samples: list[Sample], elapsed: float, clients: int) -> None:
+    ok = [s for s in samples if s.error is None and s.ttft is not None]
+    errors = Counter(s.error for s in samples if s.error is not None)
+    print(f"{len(samples)} streams from {clients} clients in {elapsed:.2f}s, {len(ok)} ok, errors: {dict(errors) or 'none'}")
+    if not ok:
+        return
+    ttft = [s.ttft for s in ok]
+    total = [s.total for s in ok]
+    print(f"  {'':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, values in (("TTFT", ttft), ("full reply", total)):
+        print(
+            f"  {name:<12}"
+            + "".join(f"{percentile(values, q) * 1000:>8.0f}ms" for q in (0.5, 0.95, 0.99))
+            + f"{max(values) * 1000:>8.0f}ms"
+        )
+    tokens = sum(s.completion_tokens for s in ok)
+    print(
+        f"  throughput: {len(ok) / elapsed:.1f} streams/s, {tokens / elapsed:.0f} completion tokens/s, "
+        f"{sum(s.chars for s in ok) / 1e3 / elapsed:.1f} kchars/s"
+    )
+
+
+async def main(args):
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=args.clients + 10, max_keepalive_connections=args.clients + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        # One at a time: SQLite deployments would trip over concurrent sign-ups
+        tokens = [await login(client, run_id, i) for i in range(args.clients)]
+        samples: list[Sample] = []
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            run_client(client, token, i, args.requests, samples) for i, token in enumerate(tokens)
+        ))
+        report(samples, time.perf_counter() - started, args.clients)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Backend base URL")
+    parser.add_argument("--clients", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=5, help="Streams per client, sent back to back")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""
+Benchmark: database commits and connection checkouts per chat turn.
+
+Compares the old per-statement session flow of the chat router with
+ChatTurnRepository on a throwaway SQLite database.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_turn --turns 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp(prefix="sparkie-bench-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("minimax_api_key", "bench")
+os.environ.setdefault("jwt_secret_key", "bench")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import event, select  # noqa: E402
+
+from app.models.database import async_session, engine, init_db, close_db, Conversation, Message  # noqa: E402
+from app.services.chat_repository import ChatTurnRepository  # noqa: E402
+
+
+class Counters:
+    """Counts commits and pool checkouts on the shared engine."""
+
+    def __init__(self):
+        self.commits = 0
+        self.checkouts = 0
+
+    def reset(self):
+        self.commits = 0
+        self.checkouts = 0
+
+
+counters = Counters()
+
+
+def _on_commit(conn):
+    counters.commits += 1
+
+
+def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+    counters.checkouts += 1
+
+
+async def legacy_turn(user_id: int, conversation_id, content: str) -> int:
+    """The chat router flow before ChatTurnRepository."""
+    if conversation_id is None:
+        conversation = Conversation(user_id=user_id, title="Chat with Sparkie")
+        async with async_session() as session:
+            session.add(conversation)
+            await session.commit()
+            await session.refresh(conversation)
+        conversation_id = conversation.id
+
+        async with async_session() as session:
+            session.add(Message(conversation_id=conversation_id, role="assistant", content="Hello!"))
+            await session.commit()
+
+    async with async_session() as session:
+        session.add(Message(conversation_id=conversation_id, role="user", content=content))
+        await session.commit()
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(Message).where(Message.conversation_id == conversation_id).order_by(Message.created_at.asc())
+        )
+        messages = list(result.scalars().all())
+    _ = messages[-20:]
+
+    async with async_session() as session:
+        session.add(Message(conversation_id=conversation_id, role="assistant", content="Reply"))
+        await session.commit()
+
+    return conversation_id
+
+
+async def repository_turn(repository: ChatTurnRepository, user_id: int, conversation_id, content: str) -> int:
+    """The chat router flow with ChatTurnRepository."""
+    turn = await repository.begin_turn(
+        user_id=user_id,
+        conversation_id=conversation_id,
+        content=content,
+        greeting="Hello!" if conversation_id is None else None
+    )
+    await repository.save_reply(turn.conversation_id, "Reply")
+    return turn.conversation_id
+
+
+async def run(label: str, turn_fn, turns: int, turns_per_conversation: int):
+    counters.reset()
+    conversation_id = None
+    started = time.perf_counter()
+    for i in range(turns):
+        if i % turns_per_conversation == 0:
+            conversation_id = None
+        conversation_id = await turn_fn(1, conversation_id, f"message {i}")
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{label:<12} turns={turns:<6} commits/turn={counters.commits / turns:5.2f} "
+        f"checkouts/turn={counters.checkouts / turns:5.2f} ms/turn={elapsed * 1000 / turns:7.3f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--turns-per-conversation", type=int, default=10)
+    args = parser.parse_args()
+
+    await init_db()
+    event.listen(engine.sync_engine, "commit", _on_commit)
+    event.listen(engine.sync_engine.pool, "checkout", _on_checkout)
+
+    repository = ChatTurnRepository()
+    await run("legacy", legacy_turn, args.turns, args.turns_per_conversation)
+    await run(
+        "repository",
+        lambda user_id, conv_id, content: repository_turn(repository, user_id, conv_id, content),
+        args.turns,
+        args.turns_per_conversation
+    )
+
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
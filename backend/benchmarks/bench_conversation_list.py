@@ -0,0 +1,162 @@
+"""
+Benchmark: listing a heavy user's conversations.
+
+Seeds one user with --conversations conversations on a throwaway SQLite
+database, then compares the old listing (OFFSET pagination plus one count
+query and session per conversation) with the keyset listing over the
+denormalized message_count, for the first page, a deep page and a walk over
+every page.
+
+Usage (from backend/):
+    python -m benchmarks.bench_conversation_list --conversations 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="sparkie-bench-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("minimax_api_key", "bench")
+os.environ.setdefault("jwt_secret_key", "bench")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import event, func, insert, select  # noqa: E402
+
+from app.models.database import async_session, engine, init_db, close_db, Conversation, Message  # noqa: E402
+from app.services.pagination import encode_cursor, keyset_before, sort_key  # noqa: E402
+
+USER_ID = 1
+statements = 0
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+async def seed(conversations: int, messages_per_conversation: int):
+    start = datetime(2024, 1, 1)
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(Conversation),
+                [
+                    {
+                        "user_id": USER_ID,
+                        "title": f"Conversation {i}",
+                        "message_count": messages_per_conversation,
+                        "updated_at": start + timedelta(seconds=i),
+                    }
+                    for i in range(conversations)
+                ]
+            )
+            await session.execute(
+                insert(Message),
+                [
+                    {"conversation_id": conv_id, "role": "user", "content": "hello"}
+                    for conv_id in range(1, conversations + 1)
+                    for _ in range(messages_per_conversation)
+                ]
+            )
+
+
+async def legacy_page(offset: int, limit: int) -> int:
+    """The listing before this change (with a working count expression)."""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Conversation)
+            .where(Conversation.user_id == USER_ID)
+            .order_by(Conversation.updated_at.desc())
+            .offset(offset)
+            .limit(limit)
+        )
+        conversations = list(result.scalars().all())
+
+    for conv in conversations:
+        async with async_session() as session:
+            count_result = await session.execute(
+                select(func.count(Message.id)).where(Message.conversation_id == conv.id)
+            )
+            count_result.scalar()
+    return len(conversations)
+
+
+async def keyset_page(cursor, limit: int):
+    """The listing query used by GET /chat/conversations."""
+    query = (
+        select(Conversation, sort_key(Conversation.updated_at).label("sort_key"))
+        .where(Conversation.user_id == USER_ID)
+    )
+    if cursor:
+        query = query.where(keyset_before(Conversation.updated_at, Conversation.id, *cursor))
+    async with async_session() as session:
+        result = await session.execute(
+            query.order_by(sort_key(Conversation.updated_at).desc(), Conversation.id.desc()).limit(limit + 1)
+        )
+        rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        conversation, key = rows[-1]
+        next_cursor = (key, conversation.id)
+        encode_cursor(key, conversation.id)
+    return len(rows), next_cursor
+
+
+async def timed(label: str, coro_factory):
+    global statements
+    statements = 0
+    started = time.perf_counter()
+    await coro_factory()
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{label:<28} {elapsed:10.2f} ms  {statements:6d} statements")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=10000)
+    parser.add_argument("--messages-per-conversation", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--deep-page", type=int, default=150)
+    args = parser.parse_args()
+
+    await init_db()
+    await seed(args.conversations, args.messages_per_conversation)
+    event.listen(engine.sync_engine, "before_cursor_execute", _on_execute)
+
+    limit = args.limit
+    pages = (args.conversations + limit - 1) // limit
+    deep_page = min(args.deep_page, pages - 1)
+
+    async def legacy_walk():
+        for page in range(pages):
+            await legacy_page(page * limit, limit)
+
+    async def keyset_to(page_count: int):
+        cursor = None
+        for _ in range(page_count):
+            _, cursor = await keyset_page(cursor, limit)
+
+    # Cursor for the deep page, so only the final request is timed
+    deep_cursor = None
+    for _ in range(deep_page):
+        _, deep_cursor = await keyset_page(deep_cursor, limit)
+
+    print(f"{args.conversations} conversations, {limit} per page, deep page = {deep_page}")
+    await timed("legacy  first page", lambda: legacy_page(0, limit))
+    await timed("keyset  first page", lambda: keyset_page(None, limit))
+    await timed("legacy  deep page", lambda: legacy_page(deep_page * limit, limit))
+    await timed("keyset  deep page", lambda: keyset_page(deep_cursor, limit))
+    await timed(f"legacy  walk {pages} pages", legacy_walk)
+    await timed(f"keyset  walk {pages} pages", lambda: keyset_to(pages))
+
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Benchmark: assembling the model's messages for one chat turn.
+
+Compares the old assembly (format the full system prompt template with a
+per-second timestamp, then tokenize it inside ContextBuilder) with
+PromptBuilder's memoized prompt and precomputed token count, and checks
+how many leading bytes two requests a few seconds apart share.
+
+Usage (from backend/):
+    python -m benchmarks.bench_prompt_builder --turns 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("minimax_api_key", "bench")
+os.environ.setdefault("jwt_secret_key", "bench")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.context_builder import ContextBuilder, estimate_tokens  # noqa: E402
+from app.services.sparkie_prompt import SPARKIE_TIME_CONTEXT, SPARKIE_SYSTEM_PROMPT, PromptBuilder  # noqa: E402
+
+# The template as it was, with the time embedded near the end
+LEGACY_TEMPLATE = SPARKIE_SYSTEM_PROMPT.replace(
+    "Current user:", "Current time context: {current_time}\nCurrent user:"
+)
+
+USERS = [f"pollinator_{i}" for i in range(50)]
+
+
+def make_history(messages: int) -> list[tuple[str, str, int]]:
+    history = []
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = f"Message {i}: " + "the hive hums with honeyed ideas " * 8
+        history.append((role, content, estimate_tokens(content)))
+    return history
+
+
+def legacy_turn(builder: ContextBuilder, history, username: str, now: datetime) -> list[dict]:
+    system_prompt = LEGACY_TEMPLATE.format(
+        current_time=now.strftime("%Y-%m-%d %H:%M:%S %Z"),
+        username=username,
+        is_creator="false"
+    )
+    return builder.build(system_prompt=system_prompt, history=history)
+
+
+def builder_turn(builder: ContextBuilder, prompts: PromptBuilder, history, username: str, now: datetime) -> list[dict]:
+    system_prompt = prompts.system_prompt(username, False)
+    return builder.build(
+        system_prompt=system_prompt.text,
+        history=history,
+        system_tokens=system_prompt.tokens,
+        context=prompts.time_context(now)
+    )
+
+
+def shared_prefix(a: list[dict], b: list[dict]) -> int:
+    x = json.dumps(a, ensure_ascii=False).encode()
+    y = json.dumps(b, ensure_ascii=False).encode()
+    for n, (p, q) in enumerate(zip(x, y)):
+        if p != q:
+            return n
+    return min(len(x), len(y))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--history", type=int, default=20, help="History messages per turn")
+    args = parser.parse_args()
+
+    builder = ContextBuilder()
+    prompts = PromptBuilder()
+    history = make_history(args.history)
+    start = datetime(2024, 1, 1, 9, 0, 0)
+
+    def timed(name: str, turn):
+        began = time.perf_counter()
+        for i in range(args.turns):
+            turn(USERS[i % len(USERS)], start + timedelta(seconds=i))
+        elapsed = time.perf_counter() - began
+        print(f"{name:<16} {elapsed / args.turns * 1e6:8.1f} us/turn")
+
+    print(f"{args.turns} turns, {len(USERS)} users, {args.history} history messages")
+    timed("legacy", lambda user, now: legacy_turn(builder, history, user, now))
+    timed("PromptBuilder", lambda user, now: builder_turn(builder, prompts, history, user, now))
+
+    later = start + timedelta(seconds=7)
+    for name, turn in (
+        ("legacy", lambda now: legacy_turn(builder, history, USERS[0], now)),
+        ("PromptBuilder", lambda now: builder_turn(builder, prompts, history, USERS[0], now)),
+    ):
+        first, second = turn(start), turn(later)
+        total = len(json.dumps(first, ensure_ascii=False).encode())
+        print(
+            f"{name:<16} requests 7s apart share {shared_prefix(first, second)} of {total} leading bytes"
+            f"{' (identical)' if first == second else ''}"
+        )
+    print(f"time context: {prompts.time_context(later)!r}  (template: {SPARKIE_TIME_CONTEXT!r})")
+
+
+if __name__ == "__main__":
+    main()
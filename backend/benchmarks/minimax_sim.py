@@ -0,0 +1,206 @@
+"""
+Local stand-in for the MiniMax chat completions API, for offline performance work.
+
+Speaks the OpenAI-compatible `/chat/completions` protocol that MiniMaxService
+uses, streaming and non-streaming, with configurable time to first token,
+token rate, reply length and injected 500 / 429 responses. Point the backend
+at it (from backend/):
+    python -m benchmarks.minimax_sim --port 9100 --ttft 0.4 --tokens-per-second 60
+    minimax_base_url=http://127.0.0.1:9100/v1 uvicorn app.main:app --port 8000
+
+Counters are served on GET /stats.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+WORDS = (
+    "Buzz buzz! The hive is humming today, and every bee knows its dance. "
+    "Pollen, nectar and a little sunshine make the sweetest honey of all. "
+).split(" ")
+
+
+@dataclass
+class SimulatorConfig:
+    """How the simulated upstream behaves; every delay is in seconds."""
+    ttft: float = 0.5
+    ttft_jitter: float = 0.1
+    tokens_per_second: float = 50.0
+    reply_tokens: int = 120
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+
+
+class SimulatorStats:
+    def __init__(self):
+        self.requests = 0
+        self.streams = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.tokens = 0
+
+    def stats(self) -> dict:
+        return dict(vars(self))
+
+
+def _prompt_tokens(messages: list[dict]) -> int:
+    # Same ~4 characters per token rule of thumb the backend estimates with
+    return sum(len(m.get("content") or "") // 4 + 4 for m in messages)
+
+
+def _reply_words(count: int) -> list[str]:
+    return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+
+def create_app(config: SimulatorConfig) -> FastAPI:
+    app = FastAPI(title="MiniMax simulator")
+    counters = SimulatorStats()
+
+    def first_token_delay() -> float:
+        return max(config.ttft + random.uniform(-config.ttft_jitter, config.ttft_jitter), 0.0)
+
+    def injected_failure() -> Optional[Response]:
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            counters.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "rate limit exceeded", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"Retry-After": f"{config.retry_after:g}"}
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            counters.errors += 1
+            return JSONResponse({"error": {"message": "simulated upstream error", "type": "server_error"}}, status_code=500)
+        return None
+
+    async def completions(request: Request):
+        body = await request.json()
+        counters.requests += 1
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        model = body.get("model", "simulated")
+        reply_tokens = min(body.get("max_tokens") or config.reply_tokens, config.reply_tokens)
+        words = _reply_words(reply_tokens)
+        prompt_tokens = _prompt_tokens(body.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": reply_tokens,
+            "total_tokens": prompt_tokens + reply_tokens,
+        }
+        completion_id = f"chatcmpl-sim-{counters.requests}"
+        created = int(time.time())
+        gap = 1.0 / config.tokens_per_second
+
+        if not body.get("stream"):
+            counters.in_flight += 1
+            counters.max_in_flight = max(counters.max_in_flight, counters.in_flight)
+            try:
+                await asyncio.sleep(first_token_delay() + gap * max(reply_tokens - 1, 0))
+            finally:
+                counters.in_flight -= 1
+            counters.tokens += reply_tokens
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None, **extra) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return b"data: " + json.dumps(payload).encode() + b"\n\n"
+
+        async def events():
+            counters.streams += 1
+            counters.in_flight += 1
+            counters.max_in_flight = max(counters.max_in_flight, counters.in_flight)
+            try:
+                await asyncio.sleep(first_token_delay())
+                yield chunk({"role": "assistant", "content": words[0] if words else ""})
+                # Pace against a deadline so event-loop lag does not slow the token rate
+                started = time.monotonic()
+                for i, word in enumerate(words[1:], start=1):
+                    delay = started + i * gap - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    yield chunk({"content": word})
+                counters.tokens += reply_tokens
+                # MiniMax reports usage on the final chunk
+                yield chunk({}, finish_reason="stop", usage=usage)
+                yield b"data: [DONE]\n\n"
+            finally:
+                counters.in_flight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # The OpenAI client appends /chat/completions to whatever base URL it is given
+    app.add_api_route("/chat/completions", completions, methods=["POST"])
+    app.add_api_route("/{prefix:path}/chat/completions", completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def stats():
+        return {"config": asdict(config), **counters.stats()}
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+    async def anything(path: str):
+        # Connection prewarming sends HEAD requests to the base URLs
+        return Response(status_code=404)
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    defaults = SimulatorConfig()
+    parser = argparse.ArgumentParser(description="Run a local MiniMax-compatible server for performance testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft", type=float, default=defaults.ttft, help="Seconds to the first token")
+    parser.add_argument("--ttft-jitter", type=float, default=defaults.ttft_jitter, help="+/- seconds of uniform jitter")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--reply-tokens", type=int, default=defaults.reply_tokens, help="Tokens per reply (capped by max_tokens)")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After seconds on 429 responses")
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        ttft=args.ttft,
+        ttft_jitter=args.ttft_jitter,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -144,7 +144,7 @@ export function useChat() {
       // Generate image
       const response = await chatAPI.generateImage(prompt);
       
-      if (response.success && response.data_url) {
+      if (response.success && (response.url || response.data_url)) {
         // Update message with generated image
         setState(prev => ({
           ...prev,